@@ -61,6 +61,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -168,6 +169,32 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory by default. Set CACHE_URL to a redis:// URL (Redis or any
+# compatible server) to share the cache between workers.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'laklak',
+        }
+    }
+
+# Anonymous catalogue responses are cached under a version that every process
+# writing the catalogue bumps: web workers, run_inventory_jobs, the event
+# consumer and management commands. A local memory cache would keep a separate
+# version per process, so the cache is only used with a shared CACHE_URL.
+CATALOGUE_CACHE_ENABLED = bool(CACHE_URL)
+CATALOGUE_CACHE_TIMEOUT = 300  # seconds an anonymous catalogue response is reused
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -233,10 +260,20 @@ EMAIL_REQUEST_TTL = 20  # Duration in which the reset link is valid (in minutes)
 # Media Settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Job uploads and artefacts; never served as static files
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private_media')
 
 # Kafka Configuration
 KAFKA_BOOTSTRAP_SERVERS = config('KAFKA_BOOTSTRAP_SERVERS', default='kafka:29092').split(',')
 
+# Extra librdkafka settings for the shared, process-wide producer
+KAFKA_PRODUCER_CONFIG = {
+    'queue.buffering.max.messages': 100000,  # bounded local queue
+    'linger.ms': 5,
+    'enable.idempotence': True,
+}
+KAFKA_PRODUCER_FLUSH_TIMEOUT = 10  # seconds to wait for pending deliveries at shutdown
+
 KAFKA_TOPICS = {
     'INVENTORY_UPDATES': 'inventory-updates',
     'LOW_STOCK_ALERTS': 'low-stock-alerts',
@@ -248,6 +285,12 @@ KAFKA_TOPICS = {
 # Stock threshold for low stock alerts
 LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 10))
 
+# PDF reports are rendered by a bounded pool of worker processes
+REPORT_RENDER_WORKERS = int(os.environ.get('REPORT_RENDER_WORKERS', 2))
+REPORT_RENDER_TIMEOUT = 120  # seconds a request waits for a render slot and for the PDF
+REPORT_CACHE_TIMEOUT = 3600  # seconds a rendered report is reused while its data is unchanged
+REPORT_SECTION_ROW_LIMIT = int(os.environ.get('REPORT_SECTION_ROW_LIMIT', 2000))  # rows listed per report section
+
 # OAuth2 Settings
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.google.GoogleOAuth2',
@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum, Min, Exists, Value, Case, When, DecimalField, BooleanField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from core.models import Package, Product
+from core.search import update_package_search_vectors
+from core.cache import bump_catalogue_version
+
+
+def package_ids_containing(product_ids):
+    return Package.products.through.objects \
+        .filter(product_id__in=product_ids) \
+        .values_list('package_id', flat=True)
+
+
+def recompute_package_total_prices(package_ids):
+    # One UPDATE for all packages, each total summed in a correlated subquery
+    price_sum = Product.objects \
+        .filter(packages=OuterRef('pk')) \
+        .order_by() \
+        .values('packages') \
+        .annotate(total=Sum('price')) \
+        .values('total')
+
+    bump_catalogue_version()
+    return Package.objects.filter(pk__in=package_ids).update(
+        total_price=Coalesce(
+            Subquery(price_sum),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        ),
+        last_modification=timezone.now()
+    )
+
+
+def recompute_package_total_prices_for_products(product_ids):
+    return recompute_package_total_prices(package_ids_containing(product_ids))
+
+
+def refresh_package_stock(package_ids):
+    # A package is as available as its scarcest product
+    members = Product.objects.filter(packages=OuterRef('pk'))
+    min_stock = members \
+        .order_by() \
+        .values('packages') \
+        .annotate(min_stock=Min('stock')) \
+        .values('min_stock')
+
+    bump_catalogue_version()
+    return Package.objects.filter(pk__in=package_ids).update(
+        min_stock=Coalesce(Subquery(min_stock), Value(0)),
+        is_available=Case(
+            When(Exists(members) & ~Exists(members.filter(stock=0)), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        ),
+        last_modification=timezone.now()
+    )
+
+
+def refresh_package_stock_for_products(product_ids):
+    return refresh_package_stock(package_ids_containing(product_ids))
+
+
+class PendingPackageUpdates:
+    def __init__(self):
+        self.price_product_ids = set()
+        self.recompute_package_ids = set()
+        self.stock_product_ids = set()
+        self.stock_package_ids = set()
+        self.search_product_ids = set()
+        self.search_package_ids = set()
+        self.flushed = False
+
+    def flush(self):
+        self.flushed = True
+        price_product_ids = set(self.price_product_ids)
+        recompute_package_ids = set(self.recompute_package_ids)
+        stock_product_ids = set(self.stock_product_ids)
+        stock_package_ids = set(self.stock_package_ids)
+        search_product_ids = set(self.search_product_ids)
+        search_package_ids = set(self.search_package_ids)
+        self.price_product_ids.clear()
+        self.recompute_package_ids.clear()
+        self.stock_product_ids.clear()
+        self.stock_package_ids.clear()
+        self.search_product_ids.clear()
+        self.search_package_ids.clear()
+        if not (price_product_ids or recompute_package_ids or stock_product_ids or stock_package_ids
+                or search_product_ids or search_package_ids):
+            return
+
+        with transaction.atomic():
+            # Totals are summed again from the committed prices rather than
+            # adjusted by deltas, so stale instances and rolled back
+            # savepoints cannot make them drift.
+            if price_product_ids:
+                recompute_package_ids.update(package_ids_containing(price_product_ids))
+            if recompute_package_ids:
+                recompute_package_total_prices(recompute_package_ids)
+            if stock_product_ids:
+                refresh_package_stock_for_products(stock_product_ids)
+            if stock_package_ids:
+                refresh_package_stock(stock_package_ids)
+            if search_product_ids:
+                update_package_search_vectors(package_ids_containing(search_product_ids))
+            if search_package_ids:
+                update_package_search_vectors(search_package_ids)
+
+
+def pending_package_updates(create=True):
+    # Package maintenance is collected per transaction and applied once on
+    # commit, so many product saves in one transaction touch each package once.
+    # Returns None outside a transaction, where changes are applied directly.
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return None
+
+    pending = getattr(connection, 'pending_package_updates', None)
+    # The callback is discarded on rollback; start over in that case.
+    if pending is None or pending.flushed or not any(
+        func == pending.flush for _, func, _ in connection.run_on_commit
+    ):
+        if not create:
+            return None
+        pending = PendingPackageUpdates()
+        connection.pending_package_updates = pending
+        transaction.on_commit(pending.flush)
+    return pending
+
+
+def schedule_package_price_refresh(product_ids):
+    pending = pending_package_updates()
+    if pending is None:
+        recompute_package_total_prices_for_products(product_ids)
+    else:
+        pending.price_product_ids.update(product_ids)
+
+
+def schedule_package_total_recompute(package_ids):
+    pending = pending_package_updates()
+    if pending is None:
+        recompute_package_total_prices(package_ids)
+    else:
+        pending.recompute_package_ids.update(package_ids)
+
+
+def schedule_package_stock_refresh(product_ids=(), package_ids=()):
+    pending = pending_package_updates()
+    if pending is None:
+        if product_ids:
+            refresh_package_stock_for_products(product_ids)
+        if package_ids:
+            refresh_package_stock(package_ids)
+    else:
+        pending.stock_product_ids.update(product_ids)
+        pending.stock_package_ids.update(package_ids)
+
+
+def schedule_package_search_refresh(product_ids=(), package_ids=()):
+    pending = pending_package_updates()
+    if pending is None:
+        if product_ids:
+            update_package_search_vectors(package_ids_containing(product_ids))
+        if package_ids:
+            update_package_search_vectors(package_ids)
+    else:
+        pending.search_product_ids.update(product_ids)
+        pending.search_package_ids.update(package_ids)
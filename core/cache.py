@@ -0,0 +1,102 @@
+import hashlib
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, parse_http_date
+from rest_framework.response import Response
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified')
+
+
+def get_catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+
+def _increment_catalogue_version():
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOGUE_VERSION_KEY, 2, timeout=None)
+
+
+def bump_catalogue_version():
+    # Cached responses are keyed by this version, so bumping it retires all of
+    # them at once. Done on commit, so a concurrent reader cannot store
+    # uncommitted state under the new version.
+    transaction.on_commit(_increment_catalogue_version)
+
+
+def catalogue_cache_key(request, scope):
+    params = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+    # The host is part of the key because paginated responses embed absolute links
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{urlencode(params)}'.encode('utf-8')
+    ).hexdigest()
+    return f'catalogue:{get_catalogue_version()}:{scope}:{digest}'
+
+
+class CatalogueCacheMixin:
+    # Anonymous GETs are served from the cache. Authenticated responses contain
+    # the user's own review and are always built fresh.
+    catalogue_cache_scope = None
+
+    def get(self, request, *args, **kwargs):
+        if request.user.is_authenticated or not settings.CATALOGUE_CACHE_ENABLED:
+            return super().get(request, *args, **kwargs)
+
+        key = catalogue_cache_key(request, self.catalogue_cache_scope or type(self).__name__)
+        cached = cache.get(key)
+        if cached is not None:
+            data, headers = cached
+            if 'ETag' in headers:
+                not_modified = get_conditional_response(
+                    request,
+                    etag=headers['ETag'],
+                    last_modified=parse_http_date(headers['Last-Modified'])
+                )
+                if not_modified is not None:
+                    return not_modified
+            return Response(data, headers=headers)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name] for name in VALIDATOR_HEADERS if response.has_header(name)}
+            cache.set(key, (response.data, headers), settings.CATALOGUE_CACHE_TIMEOUT)
+        return response
+
+
+class ConditionalRetrieveMixin:
+    # Answers If-None-Match / If-Modified-Since with a 304 before the object is
+    # serialized. get_validators() returns (etag_source, last_modified) from a
+    # cheap query, or None when the object does not exist.
+    def get_validators(self):
+        raise NotImplementedError
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag_source, last_modified = validators
+        etag = quote_etag(hashlib.md5(str(etag_source).encode('utf-8')).hexdigest())
+        last_modified = int(last_modified.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -1,5 +1,11 @@
+import re
 import django_filters
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 from core.models import Product, Package
+from core.search import SEARCH_CONFIG, trigram_available
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -16,6 +22,7 @@ class ProductFilter(django_filters.FilterSet):
 class PackageFilter(django_filters.FilterSet):
     min_total_price = django_filters.NumberFilter(field_name="total_price", lookup_expr='gte')
     max_total_price = django_filters.NumberFilter(field_name="total_price", lookup_expr='lte')
+    min_stock = django_filters.NumberFilter(field_name="min_stock", lookup_expr='gte')
     target_group = django_filters.MultipleChoiceFilter(
         choices=Package.AGE_GROUPS,
         method='filter_target_group'
@@ -28,4 +35,44 @@ class PackageFilter(django_filters.FilterSet):
 
     class Meta:
         model = Package
-        fields = ['name', 'total_price', 'target_group']
\ No newline at end of file
+        fields = ['name', 'total_price', 'target_group', 'is_available']
+
+def prefix_search_query(terms):
+    # Every word matches as a prefix, so a word still being typed finds
+    # something: 'cott' matches 'cotton'. Only word characters reach the raw
+    # tsquery, the operators are ours.
+    words = [word for term in terms for word in re.findall(r'\w+', term)]
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+class FullTextSearchFilter(SearchFilter):
+    # Matches ?search= against the indexed search_vector column and ranks the
+    # results. With pg_trgm installed, near misses on search_trigram_field
+    # ('name' by default) match too, so typos still find something. When
+    # neither finds anything, the plain ILIKE search on search_fields catches
+    # fragments from the middle of a word.
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        text = ' '.join(terms)
+        query = prefix_search_query(terms)
+        if query is None:
+            return super().filter_queryset(request, queryset, view)
+        rank = SearchRank(F('search_vector'), query)
+        condition = Q(search_vector=query)
+
+        if trigram_available():
+            trigram_field = getattr(view, 'search_trigram_field', 'name')
+            condition |= Q(**{f'{trigram_field}__trigram_word_similar': text})
+            rank = rank + TrigramWordSimilarity(text, trigram_field)
+
+        results = queryset.filter(condition).annotate(search_rank=rank)
+        if not results.exists():
+            return super().filter_queryset(request, queryset, view)
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return results
+        return results.order_by('-search_rank', 'pk')
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:07
+
+from django.db import migrations, models
+from django.db.models import Exists, Min, OuterRef, Subquery, Value, Case, When
+from django.db.models.functions import Coalesce
+
+
+def backfill_package_stock(apps, schema_editor):
+    Package = apps.get_model('core', 'Package')
+    Product = apps.get_model('core', 'Product')
+
+    members = Product.objects.filter(packages=OuterRef('pk'))
+    min_stock = members.order_by().values('packages').annotate(min_stock=Min('stock')).values('min_stock')
+    Package.objects.update(
+        min_stock=Coalesce(Subquery(min_stock), Value(0)),
+        is_available=Case(
+            When(Exists(members) & ~Exists(members.filter(stock=0)), then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_userfile_tag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='is_available',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='min_stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_package_stock, migrations.RunPython.noop),
+    ]
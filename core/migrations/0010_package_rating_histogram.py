@@ -0,0 +1,61 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_histogram(apps, schema_editor):
+    Package = apps.get_model('core', 'Package')
+    PackageReview = apps.get_model('core', 'PackageReview')
+
+    counts = {}
+    for rating in range(1, 6):
+        rating_count = PackageReview.objects \
+            .filter(package=OuterRef('pk'), rating=rating) \
+            .order_by() \
+            .values('package') \
+            .annotate(total=Count('id')) \
+            .values('total')
+        counts[f'rating_{rating}'] = Coalesce(Subquery(rating_count), Value(0))
+    Package.objects.update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_package_min_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='rating_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='rating_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='rating_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='rating_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='rating_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='packagereview',
+            index=models.Index(fields=['package', '-created_at', '-id'], name='packagereview_package_recent'),
+        ),
+        migrations.RunPython(backfill_rating_histogram, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:13
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_search_vectors(apps, schema_editor):
+    Package = apps.get_model('core', 'Package')
+    Product = apps.get_model('core', 'Product')
+
+    Product.objects.update(
+        search_vector=SearchVector('name', weight='A', config='simple') +
+        SearchVector('info', weight='B', config='simple')
+    )
+    product_names = Product.objects \
+        .filter(packages=OuterRef('pk')) \
+        .order_by() \
+        .values('packages') \
+        .annotate(names=StringAgg('name', ' ')) \
+        .values('names')
+    Package.objects.update(
+        search_vector=SearchVector('name', weight='A', config='simple') +
+        SearchVector('summary', Subquery(product_names), weight='B', config='simple') +
+        SearchVector('description', weight='C', config='simple')
+    )
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Typo-tolerant search needs pg_trgm, which not every server ships.
+    # Without it, search falls back to full-text matching only.
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+        if not cursor.fetchone()[0]:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON core_product USING gin (name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS package_name_trgm_idx ON core_package USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS package_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0010_package_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='package_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
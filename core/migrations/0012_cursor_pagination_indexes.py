@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customerorder',
+            index=models.Index(fields=['user', '-order_date', '-id'], name='customerorder_user_recent_idx'),
+        ),
+    ]
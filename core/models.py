@@ -1,4 +1,8 @@
-from django.db import models
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -54,6 +58,8 @@ class Product(models.Model):
     price = models.PositiveBigIntegerField(blank=True)
     stock = models.PositiveIntegerField(blank=True)
     images = models.ManyToManyField('ProductImage', blank=True, related_name='products')
+    # Maintained by core.search, see update_product_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
 
     groups = models.ManyToManyField(
         Group,
@@ -66,6 +72,18 @@ class Product(models.Model):
         blank=True,
     )
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Keep the loaded values so signals can tell what actually changed
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def __str__(self):
         return f"{self.name} ({self.type}) - Stock: {self.stock}"
 
@@ -99,6 +117,22 @@ class Package(models.Model):
     last_modification = models.DateTimeField(auto_now=True)
     score_sum = models.BigIntegerField(default=0)
     score_count = models.IntegerField(default=0)
+    # Maintained from member product stock by core.aggregates.refresh_package_stock
+    min_stock = models.PositiveIntegerField(default=0)
+    is_available = models.BooleanField(default=False, db_index=True)
+    # Number of reviews per star rating
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+    # Covers name, summary, description and member product names, see core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='package_search_vector_idx'),
+        ]
 
 class Discount(models.Model):
     DISCOUNT_TYPES = (
@@ -164,6 +198,11 @@ class CustomerOrder(models.Model):
     packages = models.ManyToManyField('Package', through='OrderPackage')
     is_deleted = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-order_date', '-id'], name='customerorder_user_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.user}"
 
@@ -192,30 +231,59 @@ class PackageReview(models.Model):
     class Meta:
         unique_together = ('package', 'user')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['package', '-created_at', '-id'], name='packagereview_package_recent'),
+        ]
     
     def __str__(self):
         return f"Review by {self.user.username} for {self.package.name}: {self.rating}/5"
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # The stored rating is what the package aggregates currently include
+        instance = super().from_db(db, field_names, values)
+        if 'rating' in field_names:
+            instance._loaded_rating = values[field_names.index('rating')]
+        return instance
+
+    def _stored_rating(self):
+        if hasattr(self, '_loaded_rating'):
+            return self._loaded_rating
+        return PackageReview.objects.values_list('rating', flat=True).get(pk=self.pk)
+
+    def _update_package_scores(self, score_delta, count_delta, histogram_deltas):
+        # A single UPDATE with F() expressions, so concurrent reviews never
+        # overwrite each other's changes to the package aggregates.
+        changes = {
+            f'rating_{rating}': F(f'rating_{rating}') + delta
+            for rating, delta in histogram_deltas.items() if delta
+        }
+        if score_delta:
+            changes['score_sum'] = F('score_sum') + score_delta
+        if count_delta:
+            changes['score_count'] = F('score_count') + count_delta
+        if changes:
+            Package.objects.filter(pk=self.package_id).update(last_modification=timezone.now(), **changes)
+
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        
-        if not is_new:
-            old_instance = PackageReview.objects.get(pk=self.pk)
-            old_rating = old_instance.rating
-        
-        super().save(*args, **kwargs)
-        
-        if is_new:
-            self.package.score_sum += self.rating
-            self.package.score_count += 1
-        else:
-            self.package.score_sum = self.package.score_sum - old_rating + self.rating
-        
-        self.package.save()
-    
+        is_new = self._state.adding
+
+        with transaction.atomic():
+            old_rating = None if is_new else self._stored_rating()
+            super().save(*args, **kwargs)
+
+            if is_new:
+                self._update_package_scores(self.rating, 1, {self.rating: 1})
+            elif old_rating != self.rating:
+                histogram_deltas = defaultdict(int)
+                histogram_deltas[old_rating] -= 1
+                histogram_deltas[self.rating] += 1
+                self._update_package_scores(self.rating - old_rating, 0, histogram_deltas)
+        self._loaded_rating = self.rating
+
     def delete(self, *args, **kwargs):
-        self.package.score_sum -= self.rating
-        self.package.score_count -= 1
-        self.package.save()
-        
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        with transaction.atomic():
+            rating = self._stored_rating()
+            result = super().delete(*args, **kwargs)
+            self._update_package_scores(-rating, -1, {rating: -1})
+        return result
\ No newline at end of file
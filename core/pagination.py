@@ -1,7 +1,75 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.filters import OrderingFilter, SearchFilter
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.settings import api_settings
 
 
 class ProductPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class ReviewCursorPagination(CursorPagination):
+    # Keyset pagination, served by the (package, -created_at, -id) index
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class OptInCursorPagination(CursorPagination):
+    # Clients opt in with ?pagination=cursor, then follow the next/previous
+    # links, which carry ?cursor=. Otherwise the endpoint keeps its previous
+    # behaviour: fallback_class, or no pagination at all when that is None.
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+    fallback_class = None
+
+    def __init__(self):
+        self.fallback = self.fallback_class() if self.fallback_class else None
+        self.use_cursor = False
+
+    def cursor_requested(self, request, view):
+        if request.query_params.get(self.mode_query_param) != 'cursor' \
+                and self.cursor_query_param not in request.query_params:
+            return False
+        # Search results are ordered by rank, which has no stable key to page
+        # on, so they keep the fallback unless the client orders them itself.
+        searching = any(
+            issubclass(backend, SearchFilter) and backend().get_search_terms(request)
+            for backend in getattr(view, 'filter_backends', [])
+        )
+        return not searching or bool(request.query_params.get(api_settings.ORDERING_PARAM))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_requested(request, view)
+        if self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        if self.fallback is not None:
+            return self.fallback.paginate_queryset(queryset, request, view)
+        return None
+
+    def get_paginated_response(self, data):
+        if self.use_cursor:
+            return super().get_paginated_response(data)
+        return self.fallback.get_paginated_response(data)
+
+    def to_html(self):
+        if self.use_cursor:
+            return super().to_html()
+        return self.fallback.to_html()
+
+    def get_ordering(self, request, queryset, view):
+        # Views without an OrderingFilter page by their own `ordering`
+        backends = getattr(view, 'filter_backends', [])
+        ordering = getattr(view, 'ordering', None)
+        if ordering and not any(issubclass(backend, OrderingFilter) for backend in backends):
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+
+class CatalogueCursorPagination(OptInCursorPagination):
+    page_size = 6
+    fallback_class = ProductPagination
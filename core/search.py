@@ -0,0 +1,45 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from core.models import Package, Product
+
+SEARCH_CONFIG = 'simple'
+
+_trigram_available = None
+
+
+def product_search_vector():
+    return SearchVector('name', weight='A', config=SEARCH_CONFIG) + \
+        SearchVector('info', weight='B', config=SEARCH_CONFIG)
+
+
+def package_search_vector():
+    product_names = Product.objects \
+        .filter(packages=OuterRef('pk')) \
+        .order_by() \
+        .values('packages') \
+        .annotate(names=StringAgg('name', ' ')) \
+        .values('names')
+
+    return SearchVector('name', weight='A', config=SEARCH_CONFIG) + \
+        SearchVector('summary', Subquery(product_names), weight='B', config=SEARCH_CONFIG) + \
+        SearchVector('description', weight='C', config=SEARCH_CONFIG)
+
+
+def update_product_search_vectors(product_ids):
+    return Product.objects.filter(pk__in=product_ids).update(search_vector=product_search_vector())
+
+
+def update_package_search_vectors(package_ids):
+    return Package.objects.filter(pk__in=package_ids).update(search_vector=package_search_vector())
+
+
+def trigram_available():
+    # pg_trgm is optional: the migration only enables it where the server ships it
+    global _trigram_available
+    if _trigram_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            _trigram_available = cursor.fetchone()[0]
+    return _trigram_available
@@ -67,9 +67,9 @@ class PackageReviewSerializer(serializers.ModelSerializer):
 
 class PackageSerializer(serializers.ModelSerializer):
     score = serializers.SerializerMethodField()
-    stock = serializers.SerializerMethodField()
+    stock = serializers.IntegerField(source='min_stock', read_only=True)
     products = serializers.SerializerMethodField()
-    reviews = PackageReviewSerializer(many=True, read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
     user_review = serializers.SerializerMethodField()
     
     class Meta:
@@ -78,12 +78,15 @@ class PackageSerializer(serializers.ModelSerializer):
             'id', 'name', 'summary', 'description',
             'total_price', 'image', 'products', 'is_active',
             'target_group', 'creation_date', 'score', 'stock',
-            'reviews', 'user_review', 'score_count'
+            'rating_histogram', 'user_review', 'score_count', 'is_available'
         ]
     
     def get_user_review(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            if hasattr(obj, 'current_user_reviews'):
+                reviews = obj.current_user_reviews
+                return PackageReviewSerializer(reviews[0]).data if reviews else None
             try:
                 review = PackageReview.objects.get(package=obj, user=request.user)
                 return PackageReviewSerializer(review).data
@@ -98,10 +101,9 @@ class PackageSerializer(serializers.ModelSerializer):
         avg_score = package.score_sum / package.score_count
         return round(avg_score, 2)
     
-    def get_stock(self, package):
-        minstock_product = package.products.order_by("stock")[0]
-        return minstock_product.stock
-    
+    def get_rating_histogram(self, package):
+        return {str(rating): getattr(package, f'rating_{rating}') for rating in range(1, 6)}
+
     def get_products(self, package):
         return [product.name for product in package.products.all()]
     
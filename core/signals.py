@@ -1,19 +1,129 @@
-from django.db.models.signals import post_save, m2m_changed
+from decimal import Decimal
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Product, Package
-from django.db.models import Sum
+from django.db.models import F, Sum, Subquery
+from django.utils import timezone
+from .models import Product, Package, PackageReview
+from .cache import bump_catalogue_version
+from .aggregates import (
+    schedule_package_price_refresh,
+    schedule_package_stock_refresh,
+    schedule_package_search_refresh,
+)
+from .search import update_product_search_vectors, update_package_search_vectors
+
+_UNKNOWN = object()
+
+
+def _add_to_package_totals(package_ids, delta):
+    return Package.objects.filter(pk__in=package_ids).update(
+        total_price=F('total_price') + delta,
+        last_modification=timezone.now()
+    )
+
 
 @receiver(m2m_changed, sender=Package.products.through)
-def update_total_price(sender, instance, action, **kwargs):
-    if action in ['post_add', 'post_remove', 'post_clear']:
-        total_price = instance.products.aggregate(total_price=Sum('price'))['total_price'] or 0
-        instance.total_price = total_price
-        instance.save()
+def update_total_price(sender, instance, action, reverse, pk_set, **kwargs):
+    # Package totals are adjusted by the price of the products that were added
+    # or removed instead of being summed again over the whole package.
+    if action.startswith('post_'):
+        bump_catalogue_version()
+    if not reverse:
+        if action == 'pre_remove':
+            # pk_set may name products that are not in the package
+            instance._removed_price = instance.products.filter(pk__in=pk_set) \
+                .aggregate(total=Sum('price'))['total'] or 0
+        elif action == 'post_add' and pk_set:
+            delta = Product.objects.filter(pk__in=pk_set).aggregate(total=Sum('price'))['total'] or 0
+            _add_to_package_totals([instance.pk], delta)
+            instance.total_price = Decimal(instance.total_price) + delta
+        elif action == 'post_remove':
+            delta = instance.__dict__.pop('_removed_price', 0)
+            _add_to_package_totals([instance.pk], -delta)
+            instance.total_price = Decimal(instance.total_price) - delta
+        elif action == 'post_clear':
+            Package.objects.filter(pk=instance.pk).update(total_price=0, last_modification=timezone.now())
+            instance.total_price = 0
+
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_package_stock_refresh(package_ids=[instance.pk])
+            schedule_package_search_refresh(package_ids=[instance.pk])
+        return
+
+    # Reverse side: instance is a product and pk_set holds package ids
+    if action in ('pre_remove', 'pre_clear'):
+        memberships = Package.products.through.objects.filter(product_id=instance.pk)
+        if action == 'pre_remove':
+            memberships = memberships.filter(package_id__in=pk_set)
+        instance._removed_from_packages = list(memberships.values_list('package_id', flat=True))
+        return
+
+    if action == 'post_add':
+        package_ids = pk_set or ()
+        sign = 1
+    elif action in ('post_remove', 'post_clear'):
+        package_ids = instance.__dict__.pop('_removed_from_packages', ())
+        sign = -1
+    else:
+        return
+
+    if package_ids:
+        price = Subquery(Product.objects.filter(pk=instance.pk).values('price')[:1])
+        _add_to_package_totals(package_ids, price if sign > 0 else -price)
+        schedule_package_stock_refresh(package_ids=package_ids)
+        schedule_package_search_refresh(package_ids=package_ids)
+
+
+@receiver(post_save, sender=Product)
+def update_package_total_price_on_product_save(sender, instance, created, update_fields=None, **kwargs):
+    loaded_values = instance.__dict__.setdefault('_loaded_values', {})
+    if created:
+        loaded_values['stock'] = instance.stock
+        loaded_values['price'] = instance.price
+        loaded_values['name'] = instance.name
+        loaded_values['info'] = instance.info
+        update_product_search_vectors([instance.pk])
+        return
+
+    if update_fields is None or 'price' in update_fields:
+        # Only a changed price reaches the packages. They are summed again on
+        # commit rather than adjusted, so a stale loaded price cannot drift them.
+        if loaded_values.get('price', _UNKNOWN) != instance.price:
+            schedule_package_price_refresh([instance.pk])
+        if hasattr(instance.price, 'resolve_expression'):
+            loaded_values.pop('price', None)
+        else:
+            loaded_values['price'] = instance.price
+
+    if update_fields is None or 'stock' in update_fields:
+        # stock may also be an F() expression here, which always counts as a change
+        if loaded_values.get('stock') != instance.stock:
+            schedule_package_stock_refresh(product_ids=[instance.pk])
+        if isinstance(instance.stock, int):
+            loaded_values['stock'] = instance.stock
+        else:
+            loaded_values.pop('stock', None)
+
+    text_fields = [field for field in ('name', 'info') if update_fields is None or field in update_fields]
+    changed_text = [field for field in text_fields if loaded_values.get(field) != getattr(instance, field)]
+    if changed_text:
+        update_product_search_vectors([instance.pk])
+        if 'name' in changed_text:
+            schedule_package_search_refresh(product_ids=[instance.pk])
+        for field in changed_text:
+            loaded_values[field] = getattr(instance, field)
+
+
+@receiver(post_save, sender=Package)
+def update_package_search_vector_on_save(sender, instance, **kwargs):
+    update_package_search_vectors([instance.pk])
+
 
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Package)
 @receiver(post_save, sender=Product)
-def update_package_total_price_on_product_save(sender, instance, **kwargs):
-    packages = Package.objects.filter(products=instance)
-    for package in packages:
-        total_price = package.products.aggregate(total_price=Sum('price'))['total_price'] or 0
-        package.total_price = total_price
-        package.save()
\ No newline at end of file
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=PackageReview)
+@receiver(post_delete, sender=PackageReview)
+def invalidate_catalogue_cache(sender, **kwargs):
+    bump_catalogue_version()
@@ -1,6 +1,11 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from core.models import *
+from core.search import trigram_available
 
 # Create your tests here.
 # class PackageModelTests(TestCase):
@@ -58,3 +63,345 @@ class UserTests(TestCase):
         new_user = ali_users[0]
         self.assertEqual(new_user.role, "customer")
     
+
+
+class PackageTotalPriceTests(TestCase):
+    def setUp(self):
+        self.provider = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.first = Product.objects.create(
+            provider=self.provider, name="prod1", type="food", price=5, stock=10
+        )
+        self.second = Product.objects.create(
+            provider=self.provider, name="prod2", type="clothing", price=3, stock=1
+        )
+        self.package = Package.objects.create(name="package")
+
+    def test_membership_changes_adjust_total(self):
+        self.package.products.add(self.first, self.second)
+        self.assertEqual(self.package.total_price, 8)
+        # Removing a product that is not in the package changes nothing
+        self.package.products.remove(self.second)
+        self.package.products.remove(self.second)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 5)
+
+        self.second.packages.add(self.package)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 8)
+
+    def test_price_changes_are_applied_once_on_commit(self):
+        product = Product.objects.get(pk=self.first.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.products.add(self.first, self.second)
+            product.price = 60
+            product.save()
+            product.price = 65
+            product.save()
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 65 + 3)
+
+        # Saving without touching the price leaves packages alone
+        with self.assertNumQueries(1):
+            product.stock = 4
+            product.save(update_fields=["stock"])
+
+    def test_full_save_with_unchanged_price_leaves_package_totals_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.products.add(self.first)
+        product = Product.objects.get(pk=self.first.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.stock = 4
+                product.price = 5
+                product.save()
+        self.assertFalse([query for query in queries if '"total_price"' in query["sql"]])
+
+    def test_products_added_after_a_price_change_are_not_counted_twice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.price = 20
+            self.first.save()
+            self.package.products.add(self.first)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 20)
+
+
+    def test_stale_instances_and_rolled_back_savepoints_do_not_drift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.products.add(self.first)
+        stale = [Product.objects.get(pk=self.first.pk) for _ in range(2)]
+
+        for instance, price in zip(stale, (150, 120)):
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.price = price
+                instance.save()
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 120)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    stale[0].price = 500
+                    stale[0].save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.total_price, 120)
+
+
+class PackageStockTests(TestCase):
+    def setUp(self):
+        self.provider = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.first = Product.objects.create(
+            provider=self.provider, name="prod1", type="food", price=5, stock=10
+        )
+        self.second = Product.objects.create(
+            provider=self.provider, name="prod2", type="clothing", price=3, stock=4
+        )
+        self.package = Package.objects.create(name="package")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.products.add(self.first, self.second)
+
+    def test_membership_and_saves_maintain_min_stock(self):
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.min_stock, 4)
+        self.assertTrue(self.package.is_available)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.stock = 0
+            self.second.save()
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.min_stock, 0)
+        self.assertFalse(self.package.is_available)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.products.remove(self.second)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.min_stock, 10)
+        self.assertTrue(self.package.is_available)
+
+    def test_bulk_stock_change_refreshes_packages(self):
+        self.client.force_login(self.provider)
+        response = self.client.post(
+            reverse("core:bulk-update"), {"delta": -4}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.min_stock, 0)
+        self.assertFalse(self.package.is_available)
+
+        response = self.client.get(reverse("core:package-list"), {"is_available": "false"})
+        self.assertEqual([package["id"] for package in response.json()["results"]], [self.package.id])
+
+
+class PackageListQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        provider = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.customer = CustomUser.objects.create_user(
+            username="customer", password="12345678", role="customer"
+        )
+        for index in range(5):
+            package = Package.objects.create(name=f"package {index}")
+            package.products.add(*[
+                Product.objects.create(provider=provider, name=f"prod{index}{n}", type="food", price=5, stock=3)
+                for n in range(3)
+            ])
+            for username in ("first", "second"):
+                reviewer = CustomUser.objects.create_user(username=f"{username}{index}", password="12345678")
+                PackageReview.objects.create(package=package, user=reviewer, rating=4)
+        PackageReview.objects.create(package=package, user=self.customer, rating=5)
+
+    def test_anonymous_list_runs_fixed_queries(self):
+        # count, page, products
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("core:package-list"), {"page_size": 100})
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_customer_list_prefetches_own_reviews(self):
+        self.client.force_login(self.customer)
+        # session, user, count, page, products, own reviews
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("core:package-list"), {"page_size": 100})
+        results = response.json()["results"]
+        self.assertEqual(len(results), 5)
+        self.assertEqual([item["user_review"] is not None for item in results].count(True), 1)
+        self.assertEqual(sum(item["rating_histogram"]["4"] for item in results), 10)
+        self.assertEqual(sum(item["rating_histogram"]["5"] for item in results), 1)
+
+    def test_reviews_are_paginated_by_cursor(self):
+        package = Package.objects.get(name="package 4")
+        response = self.client.get(reverse("core:package-reviews", args=[package.id]), {"page_size": 2})
+        first_page = response.json()
+        self.assertEqual(len(first_page["results"]), 2)
+        self.assertEqual(first_page["results"][0]["user_name"], "customer")
+
+        response = self.client.get(first_page["next"])
+        second_page = response.json()
+        self.assertEqual(len(second_page["results"]), 1)
+        self.assertIsNone(second_page["next"])
+
+        missing = self.client.get(reverse("core:package-reviews", args=[0]))
+        self.assertEqual(missing.status_code, 404)
+
+
+class PackageReviewScoreTests(TestCase):
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(
+            username="customer", password="12345678", role="customer"
+        )
+        self.package = Package.objects.create(name="package")
+
+    def assertScores(self, score_sum, score_count, histogram):
+        self.package.refresh_from_db()
+        self.assertEqual(self.package.score_sum, score_sum)
+        self.assertEqual(self.package.score_count, score_count)
+        self.assertEqual([getattr(self.package, f"rating_{n}") for n in range(1, 6)], histogram)
+
+    def test_review_events_update_package_in_place(self):
+        # savepoint, insert review, update package, release
+        with self.assertNumQueries(4):
+            review = PackageReview.objects.create(package=self.package, user=self.customer, rating=2)
+        self.assertScores(2, 1, [0, 1, 0, 0, 0])
+
+        # The old rating comes from load time, not from an extra query
+        review = PackageReview.objects.get(pk=review.pk)
+        review.rating = 5
+        with self.assertNumQueries(4):
+            review.save()
+        self.assertScores(5, 1, [0, 0, 0, 0, 1])
+
+        review.delete()
+        self.assertScores(0, 0, [0, 0, 0, 0, 0])
+
+
+class PackageSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        provider = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.bottle = Product.objects.create(provider=provider, name="feeding bottle", type="other", price=5, stock=3)
+        self.by_name = Package.objects.create(name="bottle starter kit")
+        self.by_product = Package.objects.create(name="newborn box")
+        self.unrelated = Package.objects.create(name="bath time")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.by_product.products.add(self.bottle)
+
+    def search(self, term):
+        response = self.client.get(reverse("core:package-list"), {"search": term})
+        return [package["id"] for package in response.json()["results"]]
+
+    def test_search_matches_product_names_and_ranks_results(self):
+        self.assertEqual(self.search("bottle"), [self.by_name.id, self.by_product.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottle.name = "sippy cup"
+            self.bottle.save()
+        self.assertEqual(self.search("bottle"), [self.by_name.id])
+        self.assertEqual(self.search("sippy"), [self.by_product.id])
+
+    def test_partial_words_match_without_trigrams(self):
+        with mock.patch("core.filters.trigram_available", return_value=False):
+            self.assertEqual(self.search("bott"), [self.by_name.id, self.by_product.id])
+            self.assertEqual(self.search("bottle sta"), [self.by_name.id])
+            # Fragments from inside a word fall back to a plain substring match
+            self.assertCountEqual(self.search("ottl"), [self.by_name.id, self.by_product.id])
+            # Typos need pg_trgm, without it they simply find nothing
+            self.assertEqual(self.search("botle"), [])
+
+    def test_partial_words_and_typos_match_with_trigrams(self):
+        if not trigram_available():
+            self.skipTest("pg_trgm is not installed")
+        self.assertEqual(self.search("bott")[:2], [self.by_name.id, self.by_product.id])
+        self.assertIn(self.by_name.id, self.search("botle"))
+
+    def test_cursor_mode_keeps_search_rank_order(self):
+        exact = Package.objects.create(name="bottle")
+        response = self.client.get(reverse("core:package-list"), {"search": "bottle", "pagination": "cursor"})
+        self.assertEqual(
+            [package["id"] for package in response.json()["results"]],
+            [self.by_name.id, exact.id, self.by_product.id]
+        )
+
+
+@override_settings(CATALOGUE_CACHE_ENABLED=True)
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.package = Package.objects.create(name="newborn box")
+
+    def test_anonymous_responses_are_cached_until_the_catalogue_changes(self):
+        url = reverse("core:package-detail", args=[self.package.id])
+        self.assertEqual(self.client.get(url).json()["name"], "newborn box")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.json()["name"], "newborn box")
+
+        # Parameter order does not matter
+        list_url = reverse("core:package-list")
+        self.client.get(list_url, {"ordering": "name", "page_size": 10})
+        with self.assertNumQueries(0):
+            self.client.get(f"{list_url}?page_size=10&ordering=name")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.package.name = "bath time"
+            self.package.save()
+        self.assertEqual(self.client.get(url).json()["name"], "bath time")
+
+    @override_settings(CATALOGUE_CACHE_ENABLED=False)
+    def test_nothing_is_cached_without_a_shared_cache(self):
+        url = reverse("core:package-detail", args=[self.package.id])
+        self.client.get(url)
+        # As if another process had changed it: no version bump reaches us
+        Package.objects.filter(pk=self.package.pk).update(name="bath time")
+        self.assertEqual(self.client.get(url).json()["name"], "bath time")
+
+
+class PackageConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.provider = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.product = Product.objects.create(
+            provider=self.provider, name="prod1", type="food", price=5, stock=10
+        )
+        self.package = Package.objects.create(name="package")
+        self.package.products.add(self.product)
+        self.client.force_login(self.provider)
+
+    def test_unchanged_package_answers_not_modified(self):
+        url = reverse("core:package-detail", args=[self.package.id])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # session, user, validators
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.product.name = "renamed"
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_editing_own_review_comment_changes_etag(self):
+        review = PackageReview.objects.create(package=self.package, user=self.provider, rating=4, comment="good")
+        url = reverse("core:package-detail", args=[self.package.id])
+        etag = self.client.get(url)["ETag"]
+
+        review.comment = "great"
+        review.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -37,6 +37,7 @@ urlpatterns = [
 
     path('packages/', views.PackageListAPIView.as_view(), name='package-list'),
     path('packages/<int:pk>/', views.PackageDetailAPIView.as_view(), name='package-detail'),
+    path('packages/<int:pk>/reviews/', views.PackageReviewListAPIView.as_view(), name='package-reviews'),
 
     path('', include('ticketing.urls')),
 
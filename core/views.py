@@ -4,6 +4,8 @@ from django.contrib.auth import get_user_model, logout
 from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404, redirect, render
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.urls import reverse
 from rest_framework.permissions import AllowAny
@@ -28,10 +30,12 @@ from core.models import (
     UserFile,
 )
 from .serializers import CustomUserSerializer, PackageSerializer, AddressSerializer, CustomTokenObtainPairSerializer
-from core.pagination import ProductPagination
-from core.filters import ProductFilter, PackageFilter
+from core.pagination import ReviewCursorPagination, OptInCursorPagination, CatalogueCursorPagination
+from core.aggregates import refresh_package_stock_for_products
+from core.cache import CatalogueCacheMixin, ConditionalRetrieveMixin
+from core.filters import ProductFilter, PackageFilter, FullTextSearchFilter
 from core.permissions import *
-from django.db.models import F, Case, When, Value, FloatField
+from django.db.models import F, Case, When, Value, FloatField, Prefetch, Max, OuterRef, Subquery
 from django.http import Http404, HttpResponseRedirect, FileResponse
 from rest_framework import viewsets, mixins
 from .serializers import PackageReviewSerializer
@@ -44,7 +48,7 @@ logger = logging.getLogger(__name__)
 
 try:
     from inventory.kafka_utils import (
-        send_inventory_update, send_price_change_event,
+        send_inventory_update, send_inventory_updates, send_price_change_event,
         send_product_created_event, send_product_deleted_event
     )
 
@@ -159,12 +163,12 @@ def register_new_product(request):
         return failure_response(str(e))
 
     try:
-        new_product = Product.objects.create(
-            type=type, name=name, info=info, is_active=True, price=price, stock=stock, provider=provider
-        )
+        with transaction.atomic():
+            new_product = Product.objects.create(
+                type=type, name=name, info=info, is_active=True, price=price, stock=stock, provider=provider
+            )
 
-        if KAFKA_AVAILABLE:
-            try:
+            if KAFKA_AVAILABLE:
                 product_data = {
                     'name': new_product.name,
                     'type': new_product.type,
@@ -173,8 +177,6 @@ def register_new_product(request):
                     'provider_id': new_product.provider_id
                 }
                 send_product_created_event(new_product.id, product_data, request.user.id)
-            except Exception as e:
-                logger.error(f"Failed to send product created event: {str(e)}")
 
         return Response({"success": "true", "id": new_product.id})
     except Exception as e:
@@ -233,17 +235,15 @@ def update_product(request):
         else:
             return failure_response('unsupported field for change: ' + field)
     try:
-        product.save()
+        with transaction.atomic():
+            product.save()
 
-        if KAFKA_AVAILABLE:
-            try:
+            if KAFKA_AVAILABLE:
                 if old_price != product.price:
                     send_price_change_event(product.id, old_price, product.price, request.user.id)
 
                 if old_stock != product.stock:
                     send_inventory_update(product.id, old_stock, product.stock, request.user.id)
-            except Exception as e:
-                logger.error(f"Failed to send product update events: {str(e)}")
 
         return Response({"success": "true"})
     except:
@@ -287,8 +287,8 @@ def delete_product(request, product_id):
     except:
         return failure_response("no such object exists", status=status.HTTP_404_NOT_FOUND)
     try:
-        if KAFKA_AVAILABLE:
-            try:
+        with transaction.atomic():
+            if KAFKA_AVAILABLE:
                 product_data = {
                     'name': product.name,
                     'type': product.type,
@@ -297,11 +297,9 @@ def delete_product(request, product_id):
                     'provider_id': product.provider_id
                 }
                 send_product_deleted_event(product_id, product_data, request.user.id)
-            except Exception as e:
-                logger.error(f"Failed to send product deleted event: {str(e)}")
 
-        product.is_deleted = True
-        product.save()
+            product.is_deleted = True
+            product.save()
         return Response({"success": "true"})
     except:
         return failure_response('server error', status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -316,34 +314,31 @@ def bulk_stock_change(request):
     except Exception as e:
         return failure_response('not provided: ' + str(e))
     try:
-        products_before = None
-        if KAFKA_AVAILABLE:
-            products_before = list(Product.objects.filter(provider_id=provider_id).values('id', 'stock'))
+        with transaction.atomic():
+            products_before = None
+            if KAFKA_AVAILABLE:
+                products_before = list(Product.objects.filter(provider_id=provider_id).values('id', 'stock'))
 
-        if delta > 0:
-            Product.objects.filter(provider_id=provider_id).update(stock=F("stock") + delta)
-        else:
-            Product.objects \
-                .filter(provider_id=provider_id, stock__gt=-delta) \
-                .update(stock=F("stock") + delta)
-            Product.objects \
-                .filter(provider_id=provider_id, stock__lte=-delta) \
-                .update(stock=0)
-
-        if KAFKA_AVAILABLE and products_before:
-            products_after = list(Product.objects.filter(provider_id=provider_id).values('id', 'stock'))
-            products_after_dict = {p['id']: p['stock'] for p in products_after}
-
-            for product in products_before:
-                product_id = product['id']
-                old_stock = product['stock']
-                new_stock = products_after_dict.get(product_id)
-
-                if old_stock != new_stock:
-                    try:
-                        send_inventory_update(product_id, old_stock, new_stock, provider_id.id)
-                    except Exception as e:
-                        logger.error(f"Failed to send inventory update for product {product_id}: {str(e)}")
+            if delta > 0:
+                Product.objects.filter(provider_id=provider_id).update(stock=F("stock") + delta, last_update=timezone.now())
+            else:
+                Product.objects \
+                    .filter(provider_id=provider_id, stock__gt=-delta) \
+                    .update(stock=F("stock") + delta, last_update=timezone.now())
+                Product.objects \
+                    .filter(provider_id=provider_id, stock__lte=-delta) \
+                    .update(stock=0, last_update=timezone.now())
+            refresh_package_stock_for_products(Product.objects.filter(provider_id=provider_id).values('id'))
+
+            if KAFKA_AVAILABLE and products_before:
+                products_after = list(Product.objects.filter(provider_id=provider_id).values('id', 'stock'))
+                products_after_dict = {p['id']: p['stock'] for p in products_after}
+
+                send_inventory_updates([
+                    (product['id'], product['stock'], products_after_dict.get(product['id']))
+                    for product in products_before
+                    if product['stock'] != products_after_dict.get(product['id'])
+                ], provider_id.id)
 
         return Response({"success": "true"})
     except Exception as e:
@@ -372,36 +367,33 @@ def granular_bulk_stock_change(request):
     except:
         return failure_response('invalid delta')
     try:
-        products_before = None
-        if KAFKA_AVAILABLE:
-            products_before = list(Product.objects.filter(pk__in=product_ids, provider=provider).values('id', 'stock'))
-
-        if (delta > 0):
-            Product.objects \
-                .filter(pk__in=product_ids, provider=provider) \
-                .update(stock=F("stock") + delta)
-        if (delta < 0):
-            Product.objects \
-                .filter(pk__in=product_ids, provider=provider, stock__gt=-delta) \
-                .update(stock=F("stock") + delta)
-            Product.objects \
-                .filter(pk__in=product_ids, provider=provider, stock__lte=-delta) \
-                .update(stock=0)
-
-        if KAFKA_AVAILABLE and products_before:
-            products_after = list(Product.objects.filter(pk__in=product_ids, provider=provider).values('id', 'stock'))
-            products_after_dict = {p['id']: p['stock'] for p in products_after}
-
-            for product in products_before:
-                product_id = product['id']
-                old_stock = product['stock']
-                new_stock = products_after_dict.get(product_id)
-
-                if old_stock != new_stock:
-                    try:
-                        send_inventory_update(product_id, old_stock, new_stock, provider.id)
-                    except Exception as e:
-                        logger.error(f"Failed to send inventory update for product {product_id}: {str(e)}")
+        with transaction.atomic():
+            products_before = None
+            if KAFKA_AVAILABLE:
+                products_before = list(Product.objects.filter(pk__in=product_ids, provider=provider).values('id', 'stock'))
+
+            if (delta > 0):
+                Product.objects \
+                    .filter(pk__in=product_ids, provider=provider) \
+                    .update(stock=F("stock") + delta, last_update=timezone.now())
+            if (delta < 0):
+                Product.objects \
+                    .filter(pk__in=product_ids, provider=provider, stock__gt=-delta) \
+                    .update(stock=F("stock") + delta, last_update=timezone.now())
+                Product.objects \
+                    .filter(pk__in=product_ids, provider=provider, stock__lte=-delta) \
+                    .update(stock=0, last_update=timezone.now())
+            refresh_package_stock_for_products(Product.objects.filter(pk__in=product_ids, provider=provider).values('id'))
+
+            if KAFKA_AVAILABLE and products_before:
+                products_after = list(Product.objects.filter(pk__in=product_ids, provider=provider).values('id', 'stock'))
+                products_after_dict = {p['id']: p['stock'] for p in products_after}
+
+                send_inventory_updates([
+                    (product['id'], product['stock'], products_after_dict.get(product['id']))
+                    for product in products_before
+                    if product['stock'] != products_after_dict.get(product['id'])
+                ], provider.id)
 
         return Response({"success": "true"})
     except Exception as e:
@@ -417,11 +409,12 @@ class LogoutAPIView(APIView):
 
 class ProductListAPIView(generics.ListAPIView):
     serializer_class = ProductSerializer
-    pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    pagination_class = CatalogueCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'info']
     ordering_fields = ['name', 'price', 'creation_date', 'type']
+    ordering = ['id']
 
     def get_queryset(self):
         if not self.request.user.is_authenticated:
@@ -432,16 +425,35 @@ class ProductListAPIView(generics.ListAPIView):
         return queryset
 
 
-class PackageListAPIView(generics.ListAPIView):
+class PackageQuerysetMixin:
+    # Everything PackageSerializer reads is fetched up front: one query each for
+    # products and the requesting user's reviews. Other reviews are served by
+    # PackageReviewListAPIView.
+    def get_package_queryset(self):
+        queryset = Package.objects.prefetch_related(
+            Prefetch('products', queryset=Product.objects.only('id', 'name')),
+        )
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.prefetch_related(Prefetch(
+                'reviews',
+                queryset=PackageReview.objects.filter(user=user).select_related('user'),
+                to_attr='current_user_reviews'
+            ))
+        return queryset
+
+
+class PackageListAPIView(CatalogueCacheMixin, PackageQuerysetMixin, generics.ListAPIView):
     serializer_class = PackageSerializer
-    pagination_class = ProductPagination
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    pagination_class = CatalogueCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, FullTextSearchFilter]
     filterset_class = PackageFilter
     search_fields = ['name', 'products__name']
-    ordering_fields = ['name', 'id', 'total_price', 'creation_date', 'score_sum']
+    ordering_fields = ['name', 'id', 'total_price', 'creation_date', 'score_sum', 'min_stock']
+    ordering = ['id']
 
     def get_queryset(self):
-        queryset = Package.objects.all()
+        queryset = self.get_package_queryset()
         queryset = queryset.annotate(
             score=Case(
                 When(score_count=0, then=Value(-1)),
@@ -470,19 +482,64 @@ class PackageReviewViewSet(mixins.CreateModelMixin,
         serializer.save()
 
 
-class PackageDetailAPIView(generics.RetrieveAPIView):
-    queryset = Package.objects.all()
+class PackageReviewListAPIView(generics.ListAPIView):
+    serializer_class = PackageReviewSerializer
+    pagination_class = ReviewCursorPagination
+
+    def get_queryset(self):
+        package_id = self.kwargs['pk']
+        if not Package.objects.filter(pk=package_id).exists():
+            raise Http404
+        return PackageReview.objects.filter(package_id=package_id).select_related('user')
+
+
+class PackageDetailAPIView(CatalogueCacheMixin, ConditionalRetrieveMixin, PackageQuerysetMixin,
+                           generics.RetrieveAPIView):
     serializer_class = PackageSerializer
     lookup_field = 'pk'
 
+    def get_queryset(self):
+        return self.get_package_queryset()
+
+    def get_validators(self):
+        # Package writes, including review and membership changes, touch
+        # last_modification. Product edits only touch the product row.
+        products_updated = Product.objects \
+            .filter(packages=OuterRef('pk')) \
+            .order_by() \
+            .values('packages') \
+            .annotate(latest=Max('last_update')) \
+            .values('latest')
+        # user_review differs per user, so the user and their review are part
+        # of the tag. Edits that keep the rating do not touch the package row.
+        user_id = self.request.user.pk if self.request.user.is_authenticated else None
+        review_updated = PackageReview.objects \
+            .filter(package=OuterRef('pk'), user_id=user_id) \
+            .order_by('-updated_at') \
+            .values('updated_at')[:1]
+        row = Package.objects \
+            .filter(pk=self.kwargs[self.lookup_field]) \
+            .values('last_modification') \
+            .annotate(products_updated=Subquery(products_updated), review_updated=Subquery(review_updated)) \
+            .first()
+        if row is None:
+            return None
+
+        last_modified = max(filter(None, [row['last_modification'], row['products_updated'], row['review_updated']]))
+        etag_source = (
+            self.kwargs[self.lookup_field], row['last_modification'], row['products_updated'],
+            user_id, row['review_updated']
+        )
+        return etag_source, last_modified
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
-    def get(self, request, *args, **kwargs):
+    def retrieve(self, request, *args, **kwargs):
         try:
-            return self.retrieve(request, *args, **kwargs)
+            return super().retrieve(request, *args, **kwargs)
         except Http404:
             return Response(
                 {"detail": "Package not found."},
@@ -545,9 +602,11 @@ class CreateCustomerOrderView(generics.CreateAPIView):
 class UserOrderHistoryView(generics.ListAPIView):
     serializer_class = serializers.CustomerOrderHistorySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OptInCursorPagination
+    ordering = ['-order_date', '-id']
 
     def get_queryset(self):
-        return models.CustomerOrder.objects.filter(user=self.request.user).order_by('-order_date')
+        return models.CustomerOrder.objects.filter(user=self.request.user).order_by(*self.ordering)
 
 
 class GoogleLoginView(APIView):
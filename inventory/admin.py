@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import InventoryTransaction, LowStockAlert, PriceChangeLog
+from .models import InventoryTransaction, LowStockAlert, PriceChangeLog, EventOutbox, Job
 
 @admin.register(InventoryTransaction)
 class InventoryTransactionAdmin(admin.ModelAdmin):
@@ -33,3 +33,30 @@ class PriceChangeLogAdmin(admin.ModelAdmin):
     search_fields = ('product__name', 'notes', 'changed_by__username')
     readonly_fields = ('product', 'old_price', 'new_price', 'changed_by', 'changed_at')
     date_hierarchy = 'changed_at'
+
+@admin.register(EventOutbox)
+class EventOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'key', 'created_at', 'published_at', 'dead_at', 'attempts')
+    list_filter = ('topic', 'published_at', 'dead_at')
+    search_fields = ('key', 'last_error')
+    readonly_fields = ('topic', 'key', 'payload', 'created_at', 'published_at', 'attempts', 'last_error', 'claimed_until', 'dead_at')
+    date_hierarchy = 'created_at'
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'user', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('user__username', 'error')
+    readonly_fields = ('kind', 'user', 'params', 'source_file', 'artefact_file', 'result',
+                       'created_at', 'started_at', 'finished_at')
+    # The file widgets link to storage.url(), which private storage refuses
+    exclude = ('source', 'artefact')
+    date_hierarchy = 'created_at'
+
+    @admin.display(description='Source')
+    def source_file(self, obj):
+        return obj.source.name or '-'
+
+    @admin.display(description='Artefact')
+    def artefact_file(self, obj):
+        return obj.artefact.name or '-'
@@ -0,0 +1,88 @@
+import csv
+import io
+import tempfile
+import openpyxl
+from django.conf import settings
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.utils import get_column_letter
+from core.models import Product
+
+
+def inventory_export_rows(user):
+    if user.role == 'supplier':
+        products = Product.objects.filter(provider=user, is_deleted=False)
+    else:
+        products = Product.objects.filter(is_deleted=False)
+    return products.order_by('id').values_list(
+        'id', 'name', 'type', 'price', 'stock', 'is_active', 'provider__username'
+    )
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def stream_inventory_csv(rows):
+    # Rows are written in batches to a small buffer that is emptied after
+    # every yield, so memory does not grow with the catalogue.
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['ID', 'Name', 'Type', 'Price', 'Stock', 'Active', 'Provider'])
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    for count, (product_id, name, product_type, price, stock, is_active, provider) in enumerate(
+        rows.iterator(chunk_size=EXPORT_CHUNK_SIZE), 1
+    ):
+        writer.writerow([product_id, name, product_type, price, stock, 'Yes' if is_active else 'No', provider])
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+EXPORT_HEADER_FONT = Font(color='FFFFFF', bold=True)
+EXPORT_HEADER_FILL = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+EXPORT_HEADER_ALIGNMENT = Alignment(horizontal='center')
+EXPORT_OUT_OF_STOCK_FILL = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
+EXPORT_LOW_STOCK_FILL = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+
+
+def write_inventory_workbook(rows):
+    # Write-only sheets keep just the current row in memory; the finished
+    # workbook is spooled to a temp file that the response streams back.
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Inventory")
+    for col_num in range(1, 8):
+        ws.column_dimensions[get_column_letter(col_num)].width = 15
+
+    header = []
+    for title in ['ID', 'Name', 'Type', 'Price', 'Stock', 'Active', 'Provider']:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = EXPORT_HEADER_FONT
+        cell.fill = EXPORT_HEADER_FILL
+        cell.alignment = EXPORT_HEADER_ALIGNMENT
+        header.append(cell)
+    ws.append(header)
+
+    for product_id, name, product_type, price, stock, is_active, provider in rows.iterator(
+        chunk_size=EXPORT_CHUNK_SIZE
+    ):
+        values = [product_id, name, product_type, price, stock, 'Yes' if is_active else 'No', provider]
+        if stock > settings.LOW_STOCK_THRESHOLD:
+            ws.append(values)
+            continue
+
+        fill = EXPORT_OUT_OF_STOCK_FILL if stock == 0 else EXPORT_LOW_STOCK_FILL
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.fill = fill
+            cells.append(cell)
+        ws.append(cells)
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return output
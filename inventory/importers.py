@@ -0,0 +1,132 @@
+import codecs
+import csv
+import uuid
+import openpyxl
+from django.db import transaction
+from django.utils import timezone
+from core.models import Product
+from core.aggregates import refresh_package_stock_for_products
+from .models import InventoryTransaction
+from .kafka_utils import inventory_update_events, enqueue_events
+
+# Stock imports run in two phases: the upload is streamed into a validated
+# {product_id: new_stock} batch without touching the database, then the whole
+# batch is applied with one locked lookup and bulk writes in one transaction.
+
+IMPORT_BATCH_SIZE = 1000
+
+IMPORT_NOTES = {
+    'xlsx': 'Imported from Excel',
+    'csv': 'Imported from CSV',
+}
+
+
+def iter_import_rows(file, file_extension):
+    # Yields (product id, stock) cells of every data row, reading the upload
+    # incrementally for both formats.
+    if file_extension == 'xlsx':
+        wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            for row in wb.active.iter_rows(min_row=2, values_only=True):
+                yield (row[0] if len(row) > 0 else None, row[4] if len(row) > 4 else None)
+        finally:
+            wb.close()
+    else:
+        reader = csv.reader(codecs.iterdecode(file, 'utf-8'))
+        next(reader, None)
+        for row in reader:
+            yield (row[0] if len(row) > 0 else None, row[4] if len(row) > 4 else None)
+
+
+def parse_stock_rows(rows, results):
+    batch = {}
+    for raw_product_id, raw_stock in rows:
+        if raw_product_id in (None, ''):
+            continue
+        try:
+            product_id = int(raw_product_id)
+            new_stock = int(raw_stock)
+        except (TypeError, ValueError) as e:
+            results['failed'].append({'product_id': raw_product_id, 'reason': str(e)})
+            continue
+
+        if new_stock < 0:
+            results['failed'].append({'product_id': product_id, 'reason': 'Stock cannot be negative'})
+            continue
+        # A product listed twice ends up with its last value, as if applied in order
+        batch[product_id] = new_stock
+    return batch
+
+
+def apply_stock_import(batch, user, notes, results):
+    with transaction.atomic():
+        products = {
+            product.id: product
+            for product in Product.objects
+                .select_for_update()
+                .filter(id__in=batch.keys(), provider=user, is_deleted=False)
+                .only('id', 'name', 'stock')
+                .order_by('id')
+        }
+
+        now = timezone.now()
+        changed = []
+        ledger = []
+        events = []
+
+        for product_id, new_stock in batch.items():
+            product = products.get(product_id)
+            if product is None:
+                results['failed'].append({
+                    'product_id': product_id,
+                    'reason': 'No Product matches the given query.'
+                })
+                continue
+
+            old_stock = product.stock
+            results['successful'].append({
+                'product_id': product.id,
+                'name': product.name,
+                'previous_stock': old_stock,
+                'new_stock': new_stock
+            })
+            if new_stock == old_stock:
+                continue
+
+            product.stock = new_stock
+            product.last_update = now
+            changed.append(product)
+
+            event_id = uuid.uuid4()
+            ledger.append(InventoryTransaction(
+                product_id=product.id,
+                quantity=new_stock - old_stock,
+                previous_stock=old_stock,
+                new_stock=new_stock,
+                transaction_type='adjust',
+                notes=notes,
+                performed_by=user,
+                timestamp=now,
+                event_id=event_id
+            ))
+            events.extend(inventory_update_events(product.id, old_stock, new_stock, user.id, event_id))
+
+        if changed:
+            Product.objects.bulk_update(changed, ['stock', 'last_update'], batch_size=IMPORT_BATCH_SIZE)
+            refresh_package_stock_for_products([product.id for product in changed])
+            InventoryTransaction.objects.bulk_create(ledger, batch_size=IMPORT_BATCH_SIZE)
+            enqueue_events(events)
+    return results
+
+
+def import_stock_file(file, file_extension, user, progress=None):
+    results = {
+        'successful': [],
+        'failed': []
+    }
+    batch = parse_stock_rows(iter_import_rows(file, file_extension), results)
+    if progress is not None:
+        progress(50)
+    if batch:
+        apply_stock_import(batch, user, IMPORT_NOTES[file_extension], results)
+    return results
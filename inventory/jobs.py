@@ -0,0 +1,155 @@
+import logging
+import tempfile
+import threading
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction, connection
+from django.utils import timezone
+from .models import Job
+from .importers import import_stock_file
+from .exports import inventory_export_rows, stream_inventory_csv, write_inventory_workbook
+from .reports import render_inventory_report, render_inventory_report_pdf
+from .pdf import pdf_rendering_available
+
+logger = logging.getLogger(__name__)
+
+MAX_JOB_ATTEMPTS = 3
+HEARTBEAT_INTERVAL = 60
+
+
+def enqueue_job(kind, user, params=None, source=None):
+    job = Job(kind=kind, user=user, params=params or {})
+    if source is not None:
+        job.source.save(source.name, source, save=False)
+    job.save()
+    return job
+
+
+def claim_next_job():
+    # skip_locked lets several workers poll the same table without handing
+    # the same job to two of them
+    with transaction.atomic():
+        job = Job.objects \
+            .select_for_update(skip_locked=True) \
+            .filter(status='pending') \
+            .order_by('created_at') \
+            .first()
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'attempts'])
+    return job
+
+
+def report_progress(job, progress):
+    job.progress = progress
+    job.heartbeat_at = timezone.now()
+    Job.objects.filter(pk=job.pk).update(progress=progress, heartbeat_at=job.heartbeat_at)
+
+
+def heartbeat(job, stop):
+    # Exports and PDF renders have no natural progress points, so a side thread
+    # keeps the job fresh for requeue_stale_jobs while the handler runs.
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+            except Exception as e:
+                logger.error(f'Heartbeat for inventory job {job.id} failed: {str(e)}')
+    finally:
+        connection.close()
+
+
+def requeue_stale_jobs(stale_after):
+    # A job whose worker died stays 'running' without progress. It is queued
+    # again, unless it already took down MAX_JOB_ATTEMPTS workers.
+    now = timezone.now()
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=now - stale_after)
+    failed = stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+        status='failed', error='The worker running this job stopped.', finished_at=now
+    )
+    requeued = stale.update(status='pending', progress=0)
+    return requeued, failed
+
+
+def purge_finished_jobs(retention):
+    # Rows go together with their files, which are not deleted by the ORM
+    jobs = Job.objects.filter(
+        status__in=['succeeded', 'failed'],
+        finished_at__lt=timezone.now() - retention
+    )
+    purged = 0
+    for job in jobs.iterator():
+        if job.source:
+            job.source.delete(save=False)
+        if job.artefact:
+            job.artefact.delete(save=False)
+        job.delete()
+        purged += 1
+    return purged
+
+
+def run_import_job(job):
+    with job.source.open('rb') as file:
+        job.result = import_stock_file(
+            file, job.params['format'], job.user,
+            progress=lambda progress: report_progress(job, progress)
+        )
+
+
+def run_export_job(job):
+    rows = inventory_export_rows(job.user)
+    if job.params.get('format') == 'excel':
+        output = write_inventory_workbook(rows)
+        filename = 'inventory.xlsx'
+    else:
+        output = tempfile.TemporaryFile()
+        for chunk in stream_inventory_csv(rows):
+            output.write(chunk)
+        output.seek(0)
+        filename = 'inventory.csv'
+
+    with output:
+        job.artefact.save(filename, File(output), save=False)
+
+
+def run_report_job(job):
+    if job.params.get('format') == 'html' or not pdf_rendering_available():
+        html_string = render_inventory_report(job.user, job.params)
+        job.artefact.save('inventory_report.html', ContentFile(html_string.encode('utf-8')), save=False)
+    else:
+        pdf = render_inventory_report_pdf(job.user, job.params)
+        job.artefact.save('inventory_report.pdf', ContentFile(pdf), save=False)
+
+
+JOB_HANDLERS = {
+    'import': run_import_job,
+    'export': run_export_job,
+    'report': run_report_job,
+}
+
+
+def run_job(job):
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job, stop), name=f'job-heartbeat-{job.id}', daemon=True)
+    beat.start()
+    try:
+        JOB_HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.error(f'Inventory job {job.id} failed: {str(e)}', exc_info=True)
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'succeeded'
+        job.progress = 100
+    finally:
+        stop.set()
+        beat.join()
+
+    if job.source:
+        job.source.delete(save=False)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'result', 'artefact', 'source', 'error', 'finished_at'])
+    return job
@@ -1,24 +1,96 @@
+import atexit
 import json
 import logging
+import os
+import threading
+import uuid
 from importlib import import_module
 from confluent_kafka import Producer, Consumer, KafkaError
 from django.conf import settings
 from django.utils import timezone
+from .models import EventOutbox
 
 logger = logging.getLogger(__name__)
 
+# One producer per worker process. confluent-kafka batches and retries in its own
+# background threads, we only need to serve delivery callbacks via poll().
+_producer = None
+_producer_pid = None
+_producer_lock = threading.Lock()
+_poll_thread = None
+_poll_stop = threading.Event()
+
+
+def _poll_loop(producer, stop_event):
+    while not stop_event.is_set():
+        try:
+            producer.poll(0.5)
+        except Exception as e:
+            logger.error(f"Kafka producer poll failed: {str(e)}")
+
+
+def _start_producer():
+    global _producer, _producer_pid, _poll_thread, _poll_stop
+
+    producer_config = {
+        'bootstrap.servers': ','.join(settings.KAFKA_BOOTSTRAP_SERVERS),
+        'client.id': 'laklak-producer',
+        'retries': 5,
+    }
+    producer_config.update(getattr(settings, 'KAFKA_PRODUCER_CONFIG', {}))
+    producer = Producer(producer_config)
+
+    # A forked child inherits the parent's globals but not its threads, so a new
+    # stop event is needed for the new poll thread.
+    _poll_stop = threading.Event()
+    _poll_thread = threading.Thread(
+        target=_poll_loop,
+        args=(producer, _poll_stop),
+        name='kafka-producer-poll',
+        daemon=True
+    )
+    _poll_thread.start()
+
+    _producer = producer
+    _producer_pid = os.getpid()
+    return producer
+
+
 def get_kafka_producer():
-    try:
-        producer_config = {
-            'bootstrap.servers': ','.join(settings.KAFKA_BOOTSTRAP_SERVERS),
-            'client.id': 'laklak-producer',
-            'retries': 5,
-        }
-        producer = Producer(producer_config)
+    producer = _producer
+    if producer is not None and _producer_pid == os.getpid():
         return producer
-    except Exception as e:
-        logger.error(f"Failed to create Kafka producer: {str(e)}")
-        return None
+
+    with _producer_lock:
+        if _producer is not None and _producer_pid == os.getpid():
+            return _producer
+        try:
+            return _start_producer()
+        except Exception as e:
+            logger.error(f"Failed to create Kafka producer: {str(e)}")
+            return None
+
+
+def flush_kafka_producer(timeout=None):
+    if _producer is None or _producer_pid != os.getpid():
+        return 0
+    if timeout is None:
+        timeout = getattr(settings, 'KAFKA_PRODUCER_FLUSH_TIMEOUT', 10)
+    remaining = _producer.flush(timeout)
+    if remaining:
+        logger.error(f"{remaining} Kafka message(s) were not delivered before the flush timeout")
+    return remaining
+
+
+def _shutdown_producer():
+    if _producer is None or _producer_pid != os.getpid():
+        return
+    _poll_stop.set()
+    flush_kafka_producer()
+
+
+atexit.register(_shutdown_producer)
+
 
 def get_kafka_consumer(topic, group_id=None):
     try:
@@ -27,10 +99,10 @@ def get_kafka_consumer(topic, group_id=None):
             'auto.offset.reset': 'earliest',
             'enable.auto.commit': True,
         }
-        
+
         if group_id:
             consumer_config['group.id'] = group_id
-        
+
         consumer = Consumer(consumer_config)
         consumer.subscribe([topic])
         return consumer
@@ -38,184 +110,117 @@ def get_kafka_consumer(topic, group_id=None):
         logger.error(f"Failed to create Kafka consumer for topic {topic}: {str(e)}")
         return None
 
-def send_inventory_update(product_id, old_stock, new_stock, user_id=None):
-    producer = get_kafka_producer()
-    if not producer:
-        logger.error("Cannot send inventory update: Kafka producer not available")
-        return False
-    
-    try:
-        message = {
-            'product_id': product_id,
-            'old_stock': old_stock,
-            'new_stock': new_stock,
-            'user_id': user_id,
-            'timestamp': str(timezone.now())
-        }
-        
-        topic = settings.KAFKA_TOPICS['INVENTORY_UPDATES']
-        key = str(product_id).encode('utf-8') if product_id else None
-        value = json.dumps(message).encode('utf-8')
-        
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=value,
-            callback=delivery_report
-        )
-        
-        producer.flush()
-        
-        if new_stock <= settings.LOW_STOCK_THRESHOLD:
-            send_low_stock_alert(product_id, new_stock)
-            
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send inventory update: {str(e)}")
-        return False
-    finally:
-        # No need to close with confluent-kafka - it's handled during garbage collection
-        pass
-
 def delivery_report(err, msg):
     if err is not None:
         logger.error(f"Message delivery failed: {err}")
     else:
         logger.debug(f"Message delivered to {msg.topic()} [{msg.partition()}]")
 
-def send_low_stock_alert(product_id, current_stock):
+def produce_message(topic, key, message, callback=delivery_report):
     producer = get_kafka_producer()
     if not producer:
-        logger.error("Cannot send low stock alert: Kafka producer not available")
-        return False
-    
-    try:
-        message = {
-            'product_id': product_id,
-            'current_stock': current_stock,
-            'threshold': settings.LOW_STOCK_THRESHOLD,
-            'timestamp': str(timezone.now())
-        }
-        
-        topic = settings.KAFKA_TOPICS['LOW_STOCK_ALERTS']
-        key = str(product_id).encode('utf-8') if product_id else None
-        value = json.dumps(message).encode('utf-8')
-        
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=value,
-            callback=delivery_report
-        )
-        
-        producer.flush()
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send low stock alert: {str(e)}")
-        return False
-    finally:
-        # No need to close with confluent-kafka
-        pass
+        raise RuntimeError("Kafka producer not available")
+
+    key = str(key).encode('utf-8') if key else None
+    value = json.dumps(message).encode('utf-8')
 
-def send_price_change_event(product_id, old_price, new_price, user_id=None):
-    producer = get_kafka_producer()
-    if not producer:
-        logger.error("Cannot send price change event: Kafka producer not available")
-        return False
-    
     try:
-        message = {
-            'product_id': product_id,
-            'old_price': str(old_price),
-            'new_price': str(new_price),
-            'user_id': user_id,
-            'timestamp': str(timezone.now())
-        }
-        
-        topic = settings.KAFKA_TOPICS['PRODUCT_PRICE_CHANGES']
-        key = str(product_id).encode('utf-8') if product_id else None
-        value = json.dumps(message).encode('utf-8')
-        
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=value,
-            callback=delivery_report
-        )
-        
-        producer.flush()
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send price change event: {str(e)}")
-        return False
-    finally:
-        # No need to close with confluent-kafka
-        pass
+        producer.produce(topic=topic, key=key, value=value, callback=callback)
+    except BufferError:
+        # The local queue is full: give the poll loop a moment to drain
+        # delivered messages and retry once before giving up.
+        logger.warning("Kafka producer queue is full, waiting for pending deliveries")
+        producer.poll(1.0)
+        producer.produce(topic=topic, key=key, value=value, callback=callback)
+
+def _outbox_entry(topic_name, product_id, message):
+    return EventOutbox(
+        topic=settings.KAFKA_TOPICS[topic_name],
+        key=str(product_id) if product_id else None,
+        payload=message
+    )
+
+def enqueue_events(entries):
+    # Events are written to the outbox in the caller's transaction and published
+    # by the relay_outbox_events command, so a rollback never leaks an event and
+    # a slow broker never blocks a request.
+    if entries:
+        EventOutbox.objects.bulk_create(entries, batch_size=1000)
+    return True
+
+def inventory_update_events(product_id, old_stock, new_stock, user_id=None, event_id=None):
+    message = {
+        'event_id': str(event_id or uuid.uuid4()),
+        'product_id': product_id,
+        'old_stock': old_stock,
+        'new_stock': new_stock,
+        'user_id': user_id,
+        'timestamp': str(timezone.now())
+    }
+    entries = [_outbox_entry('INVENTORY_UPDATES', product_id, message)]
+
+    if new_stock <= settings.LOW_STOCK_THRESHOLD:
+        entries.extend(low_stock_alert_events(product_id, new_stock))
+    return entries
+
+def low_stock_alert_events(product_id, current_stock):
+    message = {
+        'event_id': str(uuid.uuid4()),
+        'product_id': product_id,
+        'current_stock': current_stock,
+        'threshold': settings.LOW_STOCK_THRESHOLD,
+        'timestamp': str(timezone.now())
+    }
+    return [_outbox_entry('LOW_STOCK_ALERTS', product_id, message)]
+
+def price_change_events(product_id, old_price, new_price, user_id=None, event_id=None):
+    message = {
+        'event_id': str(event_id or uuid.uuid4()),
+        'product_id': product_id,
+        'old_price': str(old_price),
+        'new_price': str(new_price),
+        'user_id': user_id,
+        'timestamp': str(timezone.now())
+    }
+    return [_outbox_entry('PRODUCT_PRICE_CHANGES', product_id, message)]
+
+def product_created_events(product_id, product_data, user_id=None):
+    message = {
+        'event_id': str(uuid.uuid4()),
+        'product_id': product_id,
+        'product_data': product_data,
+        'user_id': user_id,
+        'timestamp': str(timezone.now())
+    }
+    return [_outbox_entry('PRODUCT_CREATED', product_id, message)]
+
+def product_deleted_events(product_id, product_data, user_id=None):
+    message = {
+        'event_id': str(uuid.uuid4()),
+        'product_id': product_id,
+        'product_data': product_data,
+        'user_id': user_id,
+        'timestamp': str(timezone.now())
+    }
+    return [_outbox_entry('PRODUCT_DELETED', product_id, message)]
+
+def send_inventory_update(product_id, old_stock, new_stock, user_id=None, event_id=None):
+    return enqueue_events(inventory_update_events(product_id, old_stock, new_stock, user_id, event_id))
+
+def send_inventory_updates(changes, user_id=None):
+    entries = []
+    for product_id, old_stock, new_stock in changes:
+        entries.extend(inventory_update_events(product_id, old_stock, new_stock, user_id))
+    return enqueue_events(entries)
+
+def send_low_stock_alert(product_id, current_stock):
+    return enqueue_events(low_stock_alert_events(product_id, current_stock))
+
+def send_price_change_event(product_id, old_price, new_price, user_id=None, event_id=None):
+    return enqueue_events(price_change_events(product_id, old_price, new_price, user_id, event_id))
 
 def send_product_created_event(product_id, product_data, user_id=None):
-    producer = get_kafka_producer()
-    if not producer:
-        logger.error("Cannot send product created event: Kafka producer not available")
-        return False
-    
-    try:
-        message = {
-            'product_id': product_id,
-            'product_data': product_data,
-            'user_id': user_id,
-            'timestamp': str(timezone.now())
-        }
-        
-        topic = settings.KAFKA_TOPICS['PRODUCT_CREATED']
-        key = str(product_id).encode('utf-8') if product_id else None
-        value = json.dumps(message).encode('utf-8')
-        
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=value,
-            callback=delivery_report
-        )
-        
-        producer.flush()
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send product created event: {str(e)}")
-        return False
-    finally:
-        # No need to close with confluent-kafka
-        pass
+    return enqueue_events(product_created_events(product_id, product_data, user_id))
 
 def send_product_deleted_event(product_id, product_data, user_id=None):
-    producer = get_kafka_producer()
-    if not producer:
-        logger.error("Cannot send product deleted event: Kafka producer not available")
-        return False
-    
-    try:
-        message = {
-            'product_id': product_id,
-            'product_data': product_data,
-            'user_id': user_id,
-            'timestamp': str(timezone.now())
-        }
-        
-        topic = settings.KAFKA_TOPICS['PRODUCT_DELETED']
-        key = str(product_id).encode('utf-8') if product_id else None
-        value = json.dumps(message).encode('utf-8')
-        
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=value,
-            callback=delivery_report
-        )
-        
-        producer.flush()
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send product deleted event: {str(e)}")
-        return False
-    finally:
-        # No need to close with confluent-kafka
-        pass
\ No newline at end of file
+    return enqueue_events(product_deleted_events(product_id, product_data, user_id))
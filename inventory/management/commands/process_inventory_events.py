@@ -1,18 +1,24 @@
 import json
 import logging
+import multiprocessing
+import signal
 import time
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from django.utils import timezone
-from django.db import transaction
+from django.db import transaction, connections, OperationalError, InterfaceError
 from core.models import Product, CustomUser
 from inventory.models import InventoryTransaction, LowStockAlert, PriceChangeLog
-from confluent_kafka import Consumer, KafkaError
+from inventory.rollups import refresh_inventory_rollups, refresh_price_rollups, touched_buckets
+from confluent_kafka import Consumer, KafkaError, KafkaException, TopicPartition
 import threading
+import uuid
 from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 
+EVENT_ID_NAMESPACE = uuid.UUID('6f1c4f0e-5b7a-4c39-9a53-2f1e8d2b7c41')
+MAX_RETRY_BACKOFF = 30
+
 class Command(BaseCommand):
     help = 'Process inventory events from Kafka topics'
 
@@ -23,10 +29,41 @@ class Command(BaseCommand):
             help='Specific Kafka topic to consume (default: all inventory topics)',
             required=False
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Consume up to this many messages at once and persist them in one transaction per batch',
+            required=False
+        )
+        parser.add_argument(
+            '--batch-timeout',
+            type=float,
+            default=1.0,
+            help='Seconds to wait for a batch to fill up (default: 1.0)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of consumer processes to fork per topic; they share a consumer group '
+                 'so Kafka spreads partitions across them (default: 1, threads in this process)'
+        )
         
     def handle(self, *args, **options):
         specific_topic = options.get('topic')
+        self.batch_size = options.get('batch_size')
+        self.batch_timeout = options.get('batch_timeout')
+        self.stop_requested = threading.Event()
         
+        if specific_topic and specific_topic not in settings.KAFKA_TOPICS.values():
+            self.stdout.write(self.style.ERROR(f'Unknown topic: {specific_topic}'))
+            return
+
+        if options.get('workers', 1) > 1:
+            topics = [specific_topic] if specific_topic else list(settings.KAFKA_TOPICS.values())
+            self.run_worker_processes(topics, options['workers'])
+            return
+
         if specific_topic:
             if specific_topic in settings.KAFKA_TOPICS.values():
                 self.stdout.write(self.style.SUCCESS(f'Starting consumer for topic: {specific_topic}'))
@@ -49,7 +86,64 @@ class Command(BaseCommand):
                     except Exception as e:
                         self.stdout.write(self.style.ERROR(f'Consumer error: {str(e)}'))
 
+    def run_worker_processes(self, topics, workers):
+        # Children must not share the parent's database sockets: close them
+        # before forking so every process opens its own connection.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+
+        processes = []
+        for topic in topics:
+            for index in range(workers):
+                process = context.Process(
+                    target=self.run_worker,
+                    args=(topic,),
+                    name=f'inventory-consumer-{topic}-{index}'
+                )
+                process.start()
+                processes.append(process)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Started worker {process.name} (pid {process.pid})'
+                ))
+
+        def forward_signal(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, forward_signal)
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The children received the same SIGINT and shut down on their own
+            self.stdout.write(self.style.WARNING('Waiting for workers to shut down'))
+            for process in processes:
+                process.join()
+
+        for process in processes:
+            if process.exitcode:
+                self.stdout.write(self.style.ERROR(
+                    f'Worker {process.name} exited with code {process.exitcode}'
+                ))
+
+    def run_worker(self, topic):
+        def request_stop(signum, frame):
+            self.stop_requested.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        try:
+            self.process_topic(topic)
+        finally:
+            connections.close_all()
+
     def process_topic(self, topic):
+        if self.batch_size:
+            return self.process_topic_in_batches(topic)
+
         try:
             consumer_config = {
                 'bootstrap.servers': ','.join(settings.KAFKA_BOOTSTRAP_SERVERS),
@@ -67,10 +161,8 @@ class Command(BaseCommand):
                 return
             
             self.stdout.write(self.style.SUCCESS(f'Consumer started for topic: {topic}'))
-            running = True
-            
             try:
-                while running:
+                while not self.stop_requested.is_set():
                     msg = consumer.poll(1.0)
                     
                     if msg is None:
@@ -86,19 +178,11 @@ class Command(BaseCommand):
                         try:
                             # Parse the message value
                             value = json.loads(msg.value().decode('utf-8'))
+                            value.setdefault('event_id', self.fallback_event_id(msg))
                             self.stdout.write(f'Processing message: {value}')
                             
                             # Process the message based on the topic
-                            if topic == settings.KAFKA_TOPICS['INVENTORY_UPDATES']:
-                                self.process_inventory_update(value)
-                            elif topic == settings.KAFKA_TOPICS['LOW_STOCK_ALERTS']:
-                                self.process_low_stock_alert(value)
-                            elif topic == settings.KAFKA_TOPICS['PRODUCT_PRICE_CHANGES']:
-                                self.process_price_change(value)
-                            elif topic == settings.KAFKA_TOPICS['PRODUCT_CREATED']:
-                                self.process_product_created(value)
-                            elif topic == settings.KAFKA_TOPICS['PRODUCT_DELETED']:
-                                self.process_product_deleted(value)
+                            self.process_message(topic, value)
                             
                         except Exception as e:
                             self.stdout.write(self.style.ERROR(f'Error processing message: {str(e)}'))
@@ -108,14 +192,255 @@ class Command(BaseCommand):
                     
             except KeyboardInterrupt:
                 self.stdout.write(self.style.WARNING('Stopping consumer due to keyboard interrupt'))
-                running = False
             finally:
+                self.commit_offsets(consumer)
                 consumer.close()
                 self.stdout.write(self.style.SUCCESS(f'Consumer for topic {topic} closed'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error in process_topic: {str(e)}'))
             logger.error(f'Error in process_topic: {str(e)}', exc_info=True)
 
+    def process_topic_in_batches(self, topic):
+        try:
+            consumer_config = {
+                'bootstrap.servers': ','.join(settings.KAFKA_BOOTSTRAP_SERVERS),
+                'group.id': f'inventory-processor-{topic}',
+                'auto.offset.reset': 'earliest',
+                # Offsets are committed by hand once a batch has been persisted
+                'enable.auto.commit': False,
+                'session.timeout.ms': 6000
+            }
+
+            consumer = Consumer(consumer_config)
+            consumer.subscribe([topic])
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Batch consumer started for topic: {topic} (batch size {self.batch_size})'
+            ))
+
+            backoff = 0
+            try:
+                while not self.stop_requested.is_set():
+                    messages = consumer.consume(num_messages=self.batch_size, timeout=self.batch_timeout)
+                    if not messages:
+                        continue
+
+                    values = []
+                    for msg in messages:
+                        if msg.error():
+                            if msg.error().code() == KafkaError._PARTITION_EOF:
+                                self.stdout.write(f'Reached end of topic {topic} partition {msg.partition()}')
+                            else:
+                                self.stdout.write(self.style.ERROR(f'Error: {msg.error()}'))
+                            continue
+                        try:
+                            value = json.loads(msg.value().decode('utf-8'))
+                            value.setdefault('event_id', self.fallback_event_id(msg))
+                            values.append(value)
+                        except Exception as e:
+                            self.stdout.write(self.style.ERROR(f'Error decoding message: {str(e)}'))
+                            logger.error(f'Error decoding message: {str(e)}', exc_info=True)
+
+                    if values and not self.process_message_batch(topic, values):
+                        # Nothing was stored: rewind so the batch is delivered
+                        # again instead of committing past it.
+                        self.rewind(consumer, messages)
+                        backoff = min(MAX_RETRY_BACKOFF, backoff * 2 if backoff else 1)
+                        self.stdout.write(self.style.WARNING(
+                            f'Batch for topic {topic} not stored, retrying in {backoff}s'
+                        ))
+                        self.stop_requested.wait(backoff)
+                        continue
+                    backoff = 0
+
+                    self.commit_offsets(consumer)
+
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('Stopping consumer due to keyboard interrupt'))
+            finally:
+                consumer.close()
+                self.stdout.write(self.style.SUCCESS(f'Consumer for topic {topic} closed'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error in process_topic_in_batches: {str(e)}'))
+            logger.error(f'Error in process_topic_in_batches: {str(e)}', exc_info=True)
+
+    def rewind(self, consumer, messages):
+        first_offsets = {}
+        for msg in messages:
+            if msg.error():
+                continue
+            key = (msg.topic(), msg.partition())
+            first_offsets[key] = min(first_offsets.get(key, msg.offset()), msg.offset())
+        for (topic, partition), offset in first_offsets.items():
+            consumer.seek(TopicPartition(topic, partition, offset))
+
+    def commit_offsets(self, consumer):
+        try:
+            consumer.commit(asynchronous=False)
+        except KafkaException as e:
+            # _NO_OFFSET only means nothing was consumed since the last commit.
+            # Other failures are safe to log: uncommitted events are redelivered
+            # and deduplicated by their event_id.
+            if e.args[0].code() != KafkaError._NO_OFFSET:
+                logger.error(f'Failed to commit offsets: {str(e)}')
+
+    def fallback_event_id(self, msg):
+        # Events published before producers stamped an event_id are identified
+        # by their position in the log, which stays stable across replays.
+        return str(uuid.uuid5(EVENT_ID_NAMESPACE, f'{msg.topic()}:{msg.partition()}:{msg.offset()}'))
+
+    def process_message(self, topic, value):
+        if topic == settings.KAFKA_TOPICS['INVENTORY_UPDATES']:
+            self.process_inventory_update(value)
+        elif topic == settings.KAFKA_TOPICS['LOW_STOCK_ALERTS']:
+            self.process_low_stock_alert(value)
+        elif topic == settings.KAFKA_TOPICS['PRODUCT_PRICE_CHANGES']:
+            self.process_price_change(value)
+        elif topic == settings.KAFKA_TOPICS['PRODUCT_CREATED']:
+            self.process_product_created(value)
+        elif topic == settings.KAFKA_TOPICS['PRODUCT_DELETED']:
+            self.process_product_deleted(value)
+
+    def process_message_batch(self, topic, values):
+        # Returns False when the batch could not be stored, so the caller
+        # leaves its offsets uncommitted.
+        try:
+            if topic == settings.KAFKA_TOPICS['INVENTORY_UPDATES']:
+                self.process_inventory_update_batch(values)
+            elif topic == settings.KAFKA_TOPICS['PRODUCT_PRICE_CHANGES']:
+                self.process_price_change_batch(values)
+            else:
+                for value in values:
+                    self.process_message(topic, value)
+            return True
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Error processing batch, retrying message by message: {str(e)}'))
+            logger.error(f'Error processing batch: {str(e)}', exc_info=True)
+
+        # The batch transaction was rolled back: fall back to the per-message
+        # handlers so a single bad message cannot block the whole partition.
+        # If every message fails, or the database is unreachable, the problem
+        # is not the messages and the batch has to be retried.
+        failed = 0
+        for value in values:
+            try:
+                self.process_message(topic, value)
+            except (OperationalError, InterfaceError) as e:
+                self.stdout.write(self.style.ERROR(f'Database unavailable: {str(e)}'))
+                return False
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Error processing message: {str(e)}'))
+        return failed < len(values)
+
+    def _resolve_batch_references(self, messages):
+        product_ids = {message.get('product_id') for message in messages}
+        user_ids = {message.get('user_id') for message in messages if message.get('user_id')}
+
+        products = Product.objects.in_bulk(product_ids)
+        users = CustomUser.objects.in_bulk(user_ids) if user_ids else {}
+
+        for message in messages:
+            if message.get('product_id') not in products:
+                logger.error(f"Skipping event for unknown product {message.get('product_id')}")
+        return products, users
+
+    def process_inventory_update_batch(self, messages):
+        with transaction.atomic():
+            products, users = self._resolve_batch_references(messages)
+
+            seen = set()
+            transactions = []
+            low_stock = {}
+            for message in messages:
+                product_id = message.get('product_id')
+                old_stock = message.get('old_stock')
+                new_stock = message.get('new_stock')
+                if product_id not in products:
+                    continue
+
+                event_id = message.get('event_id')
+                if event_id is None or event_id not in seen:
+                    seen.add(event_id)
+                    quantity = new_stock - old_stock
+                    transaction_type = 'add' if quantity > 0 else 'remove' if quantity < 0 else 'adjust'
+
+                    transactions.append(InventoryTransaction(
+                        product_id=product_id,
+                        quantity=abs(quantity) if transaction_type != 'adjust' else quantity,
+                        previous_stock=old_stock,
+                        new_stock=new_stock,
+                        transaction_type=transaction_type,
+                        notes='Created by Kafka event processor',
+                        performed_by=users.get(message.get('user_id')),
+                        event_id=event_id
+                    ))
+
+                if new_stock <= settings.LOW_STOCK_THRESHOLD:
+                    low_stock.setdefault(product_id, new_stock)
+
+            # Rows whose event_id is already recorded (replays, or ledger rows the
+            # API wrote itself) are skipped by the unique index.
+            InventoryTransaction.objects.bulk_create(transactions, ignore_conflicts=True)
+            refresh_inventory_rollups(touched_buckets(
+                InventoryTransaction, 'timestamp', [entry.event_id for entry in transactions]
+            ))
+
+            alerts = []
+            if low_stock:
+                alerted = set(LowStockAlert.objects.filter(
+                    product_id__in=low_stock.keys(),
+                    status__in=['pending', 'acknowledged']
+                ).values_list('product_id', flat=True))
+
+                alerts = [
+                    LowStockAlert(
+                        product_id=product_id,
+                        stock_level=stock_level,
+                        threshold=settings.LOW_STOCK_THRESHOLD,
+                        status='pending'
+                    )
+                    for product_id, stock_level in low_stock.items()
+                    if product_id not in alerted
+                ]
+                LowStockAlert.objects.bulk_create(alerts)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(messages)} inventory update(s): '
+            f'{len(transactions)} transaction record(s), {len(alerts)} low stock alert(s)'
+        ))
+
+    def process_price_change_batch(self, messages):
+        with transaction.atomic():
+            products, users = self._resolve_batch_references(messages)
+
+            seen = set()
+            price_changes = []
+            for message in messages:
+                product_id = message.get('product_id')
+                event_id = message.get('event_id')
+                if product_id not in products or (event_id is not None and event_id in seen):
+                    continue
+                seen.add(event_id)
+
+                price_changes.append(PriceChangeLog(
+                    product_id=product_id,
+                    old_price=message.get('old_price'),
+                    new_price=message.get('new_price'),
+                    changed_by=users.get(message.get('user_id')),
+                    notes='Created by Kafka event processor',
+                    event_id=event_id
+                ))
+
+            PriceChangeLog.objects.bulk_create(price_changes, ignore_conflicts=True)
+            refresh_price_rollups(touched_buckets(
+                PriceChangeLog, 'changed_at', [entry.event_id for entry in price_changes]
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(messages)} price change(s): {len(price_changes)} price change log(s)'
+        ))
+
     def process_inventory_update(self, message):
         try:
             product_id = message.get('product_id')
@@ -127,30 +452,26 @@ class Command(BaseCommand):
                 product = Product.objects.get(id=product_id)
                 user = CustomUser.objects.get(id=user_id) if user_id else None
                 
-                transaction_exists = InventoryTransaction.objects.filter(
+                quantity = new_stock - old_stock
+                transaction_type = 'add' if quantity > 0 else 'remove' if quantity < 0 else 'adjust'
+                
+                InventoryTransaction.objects.bulk_create([InventoryTransaction(
                     product=product,
+                    quantity=abs(quantity) if transaction_type != 'adjust' else quantity,
                     previous_stock=old_stock,
                     new_stock=new_stock,
-                    timestamp__gte=timezone.now() - timezone.timedelta(minutes=5)
-                ).exists()
+                    transaction_type=transaction_type,
+                    notes='Created by Kafka event processor',
+                    performed_by=user,
+                    event_id=message.get('event_id')
+                )], ignore_conflicts=True)
+                refresh_inventory_rollups(touched_buckets(
+                    InventoryTransaction, 'timestamp', [message.get('event_id')]
+                ))
                 
-                if not transaction_exists:
-                    quantity = new_stock - old_stock
-                    transaction_type = 'add' if quantity > 0 else 'remove' if quantity < 0 else 'adjust'
-                    
-                    InventoryTransaction.objects.create(
-                        product=product,
-                        quantity=abs(quantity) if transaction_type != 'adjust' else quantity,
-                        previous_stock=old_stock,
-                        new_stock=new_stock,
-                        transaction_type=transaction_type,
-                        notes='Created by Kafka event processor',
-                        performed_by=user
-                    )
-                    
-                    self.stdout.write(self.style.SUCCESS(
-                        f'Created inventory transaction record for product {product.name} (ID: {product_id})'
-                    ))
+                self.stdout.write(self.style.SUCCESS(
+                    f'Recorded inventory transaction for product {product.name} (ID: {product_id})'
+                ))
                 
                 if new_stock <= settings.LOW_STOCK_THRESHOLD:
                     existing_alert = LowStockAlert.objects.filter(
@@ -197,25 +518,21 @@ class Command(BaseCommand):
                 product = Product.objects.get(id=product_id)
                 user = CustomUser.objects.get(id=user_id) if user_id else None
                 
-                price_change_exists = PriceChangeLog.objects.filter(
+                PriceChangeLog.objects.bulk_create([PriceChangeLog(
                     product=product,
                     old_price=old_price,
                     new_price=new_price,
-                    changed_at__gte=timezone.now() - timezone.timedelta(minutes=5)
-                ).exists()
+                    changed_by=user,
+                    notes='Created by Kafka event processor',
+                    event_id=message.get('event_id')
+                )], ignore_conflicts=True)
+                refresh_price_rollups(touched_buckets(
+                    PriceChangeLog, 'changed_at', [message.get('event_id')]
+                ))
                 
-                if not price_change_exists:
-                    PriceChangeLog.objects.create(
-                        product=product,
-                        old_price=old_price,
-                        new_price=new_price,
-                        changed_by=user,
-                        notes='Created by Kafka event processor'
-                    )
-                    
-                    self.stdout.write(self.style.SUCCESS(
-                        f'Created price change log for product {product.name} (ID: {product_id})'
-                    ))
+                self.stdout.write(self.style.SUCCESS(
+                    f'Recorded price change log for product {product.name} (ID: {product_id})'
+                ))
             
             self.stdout.write(f'Processed price change for product {product_id}: {old_price} -> {new_price}')
             
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from inventory.models import InventoryTransaction, PriceChangeLog
+from inventory.rollups import rebuild_inventory_rollups, rebuild_price_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily inventory and price rollups from the raw ledger tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date-from',
+            type=str,
+            help='First day to rebuild, YYYY-MM-DD (default: the oldest ledger row)'
+        )
+        parser.add_argument(
+            '--date-to',
+            type=str,
+            help='Last day to rebuild, YYYY-MM-DD (default: today)'
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Number of days rebuilt per transaction (default: 31)'
+        )
+
+    def parse_day(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
+
+    def handle(self, *args, **options):
+        date_to = self.parse_day(options['date_to']) or timezone.localdate()
+        date_from = self.parse_day(options['date_from'])
+        if date_from is None:
+            oldest = [
+                InventoryTransaction.objects.aggregate(oldest=Min('timestamp'))['oldest'],
+                PriceChangeLog.objects.aggregate(oldest=Min('changed_at'))['oldest'],
+            ]
+            oldest = [timezone.localtime(value).date() for value in oldest if value]
+            if not oldest:
+                self.stdout.write('Nothing to roll up')
+                return
+            date_from = min(oldest)
+
+        chunk = timedelta(days=max(1, options['chunk_days']))
+        inventory_rows = price_rows = 0
+        start = date_from
+        while start <= date_to:
+            end = min(start + chunk - timedelta(days=1), date_to)
+            with transaction.atomic():
+                inventory_rows += rebuild_inventory_rollups(start, end)
+                price_rows += rebuild_price_rollups(start, end)
+            self.stdout.write(f'Rolled up {start} to {end}')
+            start = end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {inventory_rows} inventory rollup(s) and {price_rows} price rollup(s)'
+        ))
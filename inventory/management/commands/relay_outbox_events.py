@@ -0,0 +1,240 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q, Exists, OuterRef
+from django.utils import timezone
+from inventory.models import EventOutbox
+from inventory.kafka_utils import produce_message, flush_kafka_producer
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for delivery callbacks still running after a complete flush
+DELIVERY_REPORT_TIMEOUT = 5
+
+class Command(BaseCommand):
+    help = 'Publish pending events from the transactional outbox to Kafka'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Maximum number of outbox events published per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the outbox is empty (default: 1.0)'
+        )
+        parser.add_argument(
+            '--max-backoff',
+            type=float,
+            default=30.0,
+            help='Upper bound in seconds for the retry backoff after a failed batch (default: 30)'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=10,
+            help='Stop retrying an event after this many failed attempts (default: 10)'
+        )
+        parser.add_argument(
+            '--claim-timeout',
+            type=int,
+            default=300,
+            help='Seconds after which events claimed by a relay that stopped are retried (default: 300)'
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=7,
+            help='Delete published events older than this many days (default: 7)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit instead of running continuously'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        poll_interval = options['poll_interval']
+        max_backoff = options['max_backoff']
+        max_attempts = options['max_attempts']
+        claim_timeout = timedelta(seconds=options['claim_timeout'])
+        retention = timedelta(days=options['retention_days'])
+        backoff = 0
+
+        self.stdout.write(self.style.SUCCESS('Starting outbox relay'))
+
+        try:
+            while True:
+                try:
+                    published, failed = self.relay_batch(batch_size, max_attempts, claim_timeout)
+                except Exception as e:
+                    published, failed = 0, 1
+                    logger.error(f'Error relaying outbox events: {str(e)}', exc_info=True)
+
+                if published:
+                    self.stdout.write(f'Published {published} outbox event(s)')
+
+                if failed:
+                    if options['once']:
+                        self.stdout.write(self.style.WARNING(f'{failed} outbox event(s) failed'))
+                        break
+                    backoff = min(max_backoff, backoff * 2 if backoff else 1)
+                    self.stdout.write(self.style.WARNING(
+                        f'{failed} outbox event(s) failed, retrying in {backoff}s'
+                    ))
+                    time.sleep(backoff)
+                    continue
+                backoff = 0
+
+                if published < batch_size:
+                    self.purge_published(retention)
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping outbox relay due to keyboard interrupt'))
+        finally:
+            flush_kafka_producer()
+
+    def claim_batch(self, batch_size, claim_timeout):
+        # Entries are leased in a short transaction, so no row lock is held while
+        # waiting on the broker. A relay that dies mid batch leaves the lease to
+        # expire and another relay picks the entries up again. An entry whose key
+        # has an older entry leased by another relay waits for it, so events of
+        # one product are never published out of order.
+        now = timezone.now()
+        earlier_in_flight = EventOutbox.objects.filter(
+            key=OuterRef('key'),
+            id__lt=OuterRef('id'),
+            published_at__isnull=True,
+            dead_at__isnull=True,
+            claimed_until__gte=now
+        )
+        with transaction.atomic():
+            entries = list(
+                EventOutbox.objects
+                .select_for_update(skip_locked=True)
+                .filter(published_at__isnull=True, dead_at__isnull=True)
+                .filter(Q(claimed_until__isnull=True) | Q(claimed_until__lt=now))
+                .filter(~Exists(earlier_in_flight))
+                .order_by('id')[:batch_size]
+            )
+            if entries:
+                EventOutbox.objects.filter(id__in=[entry.id for entry in entries]) \
+                    .update(claimed_until=now + claim_timeout)
+        return entries
+
+    def waves(self, entries):
+        # The n-th wave holds the n-th entry of every key, so an entry is only
+        # produced once the previous one of its key is confirmed. Entries
+        # without a key have no order to keep and all go out first.
+        by_key = {}
+        first_wave = []
+        for entry in entries:
+            if entry.key is None:
+                first_wave.append(entry)
+            else:
+                by_key.setdefault(entry.key, []).append(entry)
+
+        waves = [first_wave]
+        for key_entries in by_key.values():
+            for index, entry in enumerate(key_entries):
+                if index == len(waves):
+                    waves.append([])
+                waves[index].append(entry)
+        return waves
+
+    def publish(self, entries):
+        # Delivery callbacks run on the producer's poll thread as well as in
+        # flush(), so one may still be running when flush() returns. Results
+        # are collected under a condition and the batch waits for them.
+        reported = threading.Condition()
+        results = {}
+
+        def on_delivery(entry_id):
+            def callback(err, msg):
+                with reported:
+                    if entry_id not in results:
+                        results[entry_id] = str(err) if err is not None else None
+                    reported.notify_all()
+            return callback
+
+        produced = []
+        for entry in entries:
+            try:
+                produce_message(entry.topic, entry.key, entry.payload, callback=on_delivery(entry.id))
+            except Exception as e:
+                results[entry.id] = str(e)
+            else:
+                produced.append(entry.id)
+
+        remaining = flush_kafka_producer()
+
+        with reported:
+            reported.wait_for(
+                lambda: all(entry_id in results for entry_id in produced),
+                timeout=0 if remaining else DELIVERY_REPORT_TIMEOUT
+            )
+            for entry_id in produced:
+                results.setdefault(entry_id, 'Delivery not confirmed before flush timeout')
+            return dict(results)
+
+    def relay_batch(self, batch_size, max_attempts, claim_timeout):
+        entries = self.claim_batch(batch_size, claim_timeout)
+        if not entries:
+            return 0, 0
+
+        delivered = set()
+        errors = {}
+        failed_keys = set()
+        for wave in self.waves(entries):
+            # After a failure the rest of that key waits for the retry
+            wave = [entry for entry in wave if entry.key is None or entry.key not in failed_keys]
+            if not wave:
+                continue
+            for entry_id, error in self.publish(wave).items():
+                if error is None:
+                    delivered.add(entry_id)
+                else:
+                    errors[entry_id] = error
+            failed_keys.update(entry.key for entry in wave if entry.id in errors)
+
+        held_back = [entry.id for entry in entries if entry.id not in delivered and entry.id not in errors]
+
+        by_error = {}
+        for entry_id, error in errors.items():
+            by_error.setdefault(error, []).append(entry_id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            if delivered:
+                EventOutbox.objects.filter(id__in=delivered).update(published_at=now, claimed_until=None)
+            if held_back:
+                EventOutbox.objects.filter(id__in=held_back).update(claimed_until=None)
+            for error, entry_ids in by_error.items():
+                EventOutbox.objects.filter(id__in=entry_ids).update(
+                    attempts=F('attempts') + 1,
+                    last_error=error,
+                    claimed_until=None
+                )
+            dead = EventOutbox.objects \
+                .filter(id__in=errors.keys(), attempts__gte=max_attempts) \
+                .update(dead_at=now)
+
+        if dead:
+            logger.error(f'Gave up on {dead} outbox event(s) after {max_attempts} attempts')
+        return len(delivered), len(errors) + len(held_back)
+
+    def purge_published(self, retention):
+        EventOutbox.objects.filter(
+            published_at__isnull=False,
+            published_at__lt=timezone.now() - retention
+        ).delete()
@@ -0,0 +1,81 @@
+import logging
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from inventory.jobs import claim_next_job, run_job, requeue_stale_jobs, purge_finished_jobs
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Run queued inventory import, export and report jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when no job is pending (default: 1.0)'
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=30,
+            help='Minutes without progress after which a running job is considered abandoned (default: 30)'
+        )
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=7,
+            help='Delete finished jobs and their files older than this many days (default: 7)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the pending jobs once and exit instead of running continuously'
+        )
+
+    def handle(self, *args, **options):
+        poll_interval = options['poll_interval']
+        stale_after = timedelta(minutes=options['stale_after'])
+        retention = timedelta(days=options['retention_days'])
+
+        self.stdout.write(self.style.SUCCESS('Starting inventory job worker'))
+
+        try:
+            while True:
+                try:
+                    job = claim_next_job()
+                except Exception as e:
+                    job = None
+                    logger.error(f'Error claiming inventory job: {str(e)}', exc_info=True)
+
+                if job is None:
+                    self.housekeeping(stale_after, retention)
+                    if options['once']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f'Running {job.kind} job {job.id}')
+                run_job(job)
+                if job.status == 'failed':
+                    self.stdout.write(self.style.WARNING(f'Job {job.id} failed: {job.error}'))
+                else:
+                    self.stdout.write(f'Job {job.id} finished')
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping inventory job worker due to keyboard interrupt'))
+
+    def housekeeping(self, stale_after, retention):
+        try:
+            requeued, failed = requeue_stale_jobs(stale_after)
+            purged = purge_finished_jobs(retention)
+        except Exception as e:
+            logger.error(f'Error cleaning up inventory jobs: {str(e)}', exc_info=True)
+            return
+
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} abandoned job(s)'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Gave up on {failed} abandoned job(s)'))
+        if purged:
+            self.stdout.write(f'Deleted {purged} old job(s)')
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_eventoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorytransaction',
+            name='event_id',
+            field=models.UUIDField(blank=True, editable=False, help_text='Id of the Kafka event describing this change, used for deduplication', null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='pricechangelog',
+            name='event_id',
+            field=models.UUIDField(blank=True, editable=False, help_text='Id of the Kafka event describing this change, used for deduplication', null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_cursor_pagination_indexes'),
+        ('inventory', '0003_event_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['-timestamp', '-id'], name='invtransaction_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricechangelog',
+            index=models.Index(fields=['-changed_at', '-id'], name='pricechangelog_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+BACKFILL_INVENTORY_SQL = '''
+INSERT INTO inventory_dailyinventoryrollup (
+    product_id, day, transaction_count, total_quantity,
+    add_count, add_quantity, remove_count, remove_quantity,
+    adjust_count, adjust_quantity, closing_stock
+)
+SELECT
+    product_id,
+    (timestamp AT TIME ZONE %(tz)s)::date,
+    COUNT(*),
+    COALESCE(SUM(quantity), 0),
+    COUNT(*) FILTER (WHERE transaction_type = 'add'),
+    COALESCE(SUM(quantity) FILTER (WHERE transaction_type = 'add'), 0),
+    COUNT(*) FILTER (WHERE transaction_type = 'remove'),
+    COALESCE(SUM(quantity) FILTER (WHERE transaction_type = 'remove'), 0),
+    COUNT(*) FILTER (WHERE transaction_type = 'adjust'),
+    COALESCE(SUM(quantity) FILTER (WHERE transaction_type = 'adjust'), 0),
+    (ARRAY_AGG(new_stock ORDER BY timestamp DESC, id DESC))[1]
+FROM inventory_inventorytransaction
+GROUP BY 1, 2
+ON CONFLICT (product_id, day) DO NOTHING
+'''
+
+BACKFILL_PRICE_SQL = '''
+INSERT INTO inventory_dailypricerollup (
+    product_id, day, change_count, increase_count, increase_total,
+    decrease_count, decrease_total, closing_price
+)
+SELECT
+    product_id,
+    (changed_at AT TIME ZONE %(tz)s)::date,
+    COUNT(*),
+    COUNT(*) FILTER (WHERE new_price > old_price),
+    COALESCE(SUM(new_price - old_price) FILTER (WHERE new_price > old_price), 0),
+    COUNT(*) FILTER (WHERE new_price < old_price),
+    COALESCE(SUM(old_price - new_price) FILTER (WHERE new_price < old_price), 0),
+    (ARRAY_AGG(new_price ORDER BY changed_at DESC, id DESC))[1]
+FROM inventory_pricechangelog
+GROUP BY 1, 2
+ON CONFLICT (product_id, day) DO NOTHING
+'''
+
+
+def backfill_rollups(apps, schema_editor):
+    params = {'tz': settings.TIME_ZONE}
+    schema_editor.execute(BACKFILL_INVENTORY_SQL, params)
+    schema_editor.execute(BACKFILL_PRICE_SQL, params)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_cursor_pagination_indexes'),
+        ('inventory', '0004_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyInventoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('total_quantity', models.BigIntegerField(default=0)),
+                ('add_count', models.PositiveIntegerField(default=0)),
+                ('add_quantity', models.BigIntegerField(default=0)),
+                ('remove_count', models.PositiveIntegerField(default=0)),
+                ('remove_quantity', models.BigIntegerField(default=0)),
+                ('adjust_count', models.PositiveIntegerField(default=0)),
+                ('adjust_quantity', models.BigIntegerField(default=0)),
+                ('closing_stock', models.PositiveIntegerField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_inventory_rollups', to='core.product')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='inventory_d_day_d3baed_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='dailyinventoryrollup_product_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('change_count', models.PositiveIntegerField(default=0)),
+                ('increase_count', models.PositiveIntegerField(default=0)),
+                ('increase_total', models.BigIntegerField(default=0)),
+                ('decrease_count', models.PositiveIntegerField(default=0)),
+                ('decrease_total', models.BigIntegerField(default=0)),
+                ('closing_price', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_price_rollups', to='core.product')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['day'], name='inventory_d_day_35faac_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'day'), name='dailypricerollup_product_day')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:27
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_daily_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('import', 'Inventory Import'), ('export', 'Inventory Export'), ('report', 'Inventory Report')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('source', models.FileField(blank=True, upload_to='jobs/sources/')),
+                ('artefact', models.FileField(blank=True, upload_to='jobs/artefacts/')),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Percentage of the work done')),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['created_at'], name='job_pending_idx'), models.Index(fields=['user', '-created_at'], name='inventory_j_user_id_15da10_idx')],
+            },
+        ),
+    ]
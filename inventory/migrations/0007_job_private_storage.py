@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:51
+
+import inventory.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker running the job', null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='artefact',
+            field=models.FileField(blank=True, storage=inventory.storage.PrivateStorage(), upload_to=inventory.storage.job_artefact_path),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='source',
+            field=models.FileField(blank=True, storage=inventory.storage.PrivateStorage(), upload_to=inventory.storage.job_source_path),
+        ),
+    ]
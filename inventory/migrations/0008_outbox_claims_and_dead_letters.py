@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_job_private_storage'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='eventoutbox',
+            name='eventoutbox_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='eventoutbox',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, help_text='Lease of the relay currently publishing the event', null=True),
+        ),
+        migrations.AddField(
+            model_name='eventoutbox',
+            name='dead_at',
+            field=models.DateTimeField(blank=True, help_text='Set when the relay gave up on the event', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='eventoutbox',
+            index=models.Index(condition=models.Q(('dead_at__isnull', True), ('published_at__isnull', True)), fields=['id'], name='eventoutbox_pending_idx'),
+        ),
+    ]
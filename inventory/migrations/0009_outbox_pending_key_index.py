@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_outbox_claims_and_dead_letters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventoutbox',
+            index=models.Index(condition=models.Q(('dead_at__isnull', True), ('published_at__isnull', True)), fields=['key', 'id'], name='eventoutbox_pending_key_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
+import uuid
 from django.db import models
 from django.utils import timezone
 from core.models import Product, CustomUser
+from .storage import PrivateStorage, job_source_path, job_artefact_path
 
 class InventoryTransaction(models.Model):
     TRANSACTION_TYPES = (
@@ -18,6 +20,8 @@ class InventoryTransaction(models.Model):
     notes = models.TextField(blank=True, null=True)
     performed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='inventory_transactions')
     timestamp = models.DateTimeField(default=timezone.now)
+    event_id = models.UUIDField(unique=True, null=True, blank=True, editable=False,
+                                help_text="Id of the Kafka event describing this change, used for deduplication")
     
     def __str__(self):
         return f"{self.transaction_type} - {self.product.name} ({self.quantity})"
@@ -28,6 +32,7 @@ class InventoryTransaction(models.Model):
             models.Index(fields=['product', 'timestamp']),
             models.Index(fields=['transaction_type']),
             models.Index(fields=['performed_by']),
+            models.Index(fields=['-timestamp', '-id'], name='invtransaction_recent_idx'),
         ]
 
 class LowStockAlert(models.Model):
@@ -64,6 +69,8 @@ class PriceChangeLog(models.Model):
     changed_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, related_name='price_changes')
     changed_at = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True, null=True)
+    event_id = models.UUIDField(unique=True, null=True, blank=True, editable=False,
+                                help_text="Id of the Kafka event describing this change, used for deduplication")
     
     def __str__(self):
         return f"Price Change - {self.product.name} ({self.old_price} → {self.new_price})"
@@ -73,4 +80,127 @@ class PriceChangeLog(models.Model):
         indexes = [
             models.Index(fields=['product', 'changed_at']),
             models.Index(fields=['changed_by']),
+            models.Index(fields=['-changed_at', '-id'], name='pricechangelog_recent_idx'),
+        ]
+
+class EventOutbox(models.Model):
+    topic = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, blank=True, null=True)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    published_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    claimed_until = models.DateTimeField(null=True, blank=True, help_text='Lease of the relay currently publishing the event')
+    dead_at = models.DateTimeField(null=True, blank=True, help_text='Set when the relay gave up on the event')
+
+    def __str__(self):
+        if self.published_at:
+            state = 'published'
+        elif self.dead_at:
+            state = 'dead'
+        else:
+            state = 'pending'
+        return f"Outbox event {self.id} - {self.topic} ({state})"
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(published_at__isnull=True, dead_at__isnull=True), name='eventoutbox_pending_idx'),
+            models.Index(fields=['key', 'id'], condition=models.Q(published_at__isnull=True, dead_at__isnull=True), name='eventoutbox_pending_key_idx'),
+            models.Index(fields=['published_at']),
+        ]
+
+
+class DailyInventoryRollup(models.Model):
+    # Per product and day totals of InventoryTransaction, see inventory.rollups
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_inventory_rollups')
+    day = models.DateField()
+    transaction_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    add_count = models.PositiveIntegerField(default=0)
+    add_quantity = models.BigIntegerField(default=0)
+    remove_count = models.PositiveIntegerField(default=0)
+    remove_quantity = models.BigIntegerField(default=0)
+    adjust_count = models.PositiveIntegerField(default=0)
+    adjust_quantity = models.BigIntegerField(default=0)
+    closing_stock = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.product.name} on {self.day} ({self.transaction_count} transactions)"
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='dailyinventoryrollup_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+class DailyPriceRollup(models.Model):
+    # Per product and day totals of PriceChangeLog, see inventory.rollups
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_price_rollups')
+    day = models.DateField()
+    change_count = models.PositiveIntegerField(default=0)
+    increase_count = models.PositiveIntegerField(default=0)
+    increase_total = models.BigIntegerField(default=0)
+    decrease_count = models.PositiveIntegerField(default=0)
+    decrease_total = models.BigIntegerField(default=0)
+    closing_price = models.PositiveBigIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.product.name} on {self.day} ({self.change_count} price changes)"
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='dailypricerollup_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+
+class Job(models.Model):
+    # Long running imports, exports and reports, queued in the database and
+    # executed by the run_inventory_jobs command
+    KIND_CHOICES = (
+        ('import', 'Inventory Import'),
+        ('export', 'Inventory Export'),
+        ('report', 'Inventory Report'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='inventory_jobs')
+    params = models.JSONField(default=dict, blank=True)
+    # Kept out of MEDIA_ROOT under a per-job path, see inventory.storage
+    source = models.FileField(upload_to=job_source_path, storage=PrivateStorage(), blank=True)
+    artefact = models.FileField(upload_to=job_artefact_path, storage=PrivateStorage(), blank=True)
+    result = models.JSONField(null=True, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percentage of the work done")
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True,
+                                        help_text="Last sign of life from the worker running the job")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(status='pending'), name='job_pending_idx'),
+            models.Index(fields=['user', '-created_at']),
         ]
@@ -0,0 +1,66 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from django.conf import settings
+
+try:
+    from weasyprint import HTML
+except (ImportError, OSError):
+    # weasyprint needs the Pango system libraries; without them reports fall back to HTML
+    HTML = None
+
+
+class ReportRenderBusy(Exception):
+    pass
+
+
+class ReportRenderTimeout(Exception):
+    pass
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def pdf_rendering_available():
+    return HTML is not None
+
+
+def write_pdf(html_string, base_url=None):
+    return HTML(string=html_string, base_url=base_url).write_pdf()
+
+
+def get_render_pool():
+    # Rendering is CPU bound, so it runs in separate processes. The semaphore
+    # caps queued renders at twice the pool size; beyond that callers are
+    # turned away instead of piling up behind the pool.
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            # Forking a threaded web process can copy held locks into the
+            # child; forkserver starts workers from a clean process instead.
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.REPORT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+            _slots = threading.BoundedSemaphore(settings.REPORT_RENDER_WORKERS * 2)
+    return _executor, _slots
+
+
+def render_pdf(html_string, base_url=None):
+    executor, slots = get_render_pool()
+    if not slots.acquire(timeout=settings.REPORT_RENDER_TIMEOUT):
+        raise ReportRenderBusy('All report renderers are busy, try again later or use ?async=1.')
+    try:
+        future = executor.submit(write_pdf, html_string, base_url)
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the render really ends, even if the caller stops
+    # waiting, so abandoned renders still count against the bound.
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(timeout=settings.REPORT_RENDER_TIMEOUT)
+    except FutureTimeoutError:
+        raise ReportRenderTimeout('The report took too long to render, try again later or use ?async=1.')
@@ -0,0 +1,199 @@
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum, Max, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from core.models import Product
+from .models import InventoryTransaction, DailyInventoryRollup
+from .rollups import inventory_totals, inventory_totals_by_product
+from .pdf import render_pdf
+
+
+def report_section(rows, total):
+    # Detail tables list at most REPORT_SECTION_ROW_LIMIT rows, read as plain
+    # values. The template loads a section's rows as a whole and the rendered
+    # document is built in memory, so this cap is what bounds memory use. The
+    # total comes from the summary aggregates, so telling that a section was
+    # cut short costs no query.
+    limit = settings.REPORT_SECTION_ROW_LIMIT
+    return {
+        'rows': rows[:limit],
+        'total': total,
+        'truncated': total > limit,
+        'limit': limit,
+    }
+
+
+def build_inventory_report(user, params):
+    report_type = params.get('type', 'inventory')
+    date_from = params.get('date_from')
+    date_to = params.get('date_to')
+    
+    date_filter = Q()
+    rollups_filter = Q()
+    if date_from:
+        try:
+            date_from = parse_date(date_from)
+            date_filter &= Q(timestamp__gte=date_from)
+            rollups_filter &= Q(day__gte=date_from)
+        except:
+            pass
+    
+    if date_to:
+        try:
+            date_to = parse_date(date_to)
+            date_to = date_to + timedelta(days=1)
+            date_filter &= Q(timestamp__lt=date_to)
+            rollups_filter &= Q(day__lt=date_to)
+        except:
+            pass
+    
+    if user.role == 'supplier':
+        products = Product.objects.filter(provider=user, is_deleted=False)
+        transactions = InventoryTransaction.objects.filter(
+            product__provider=user
+        ).filter(date_filter)
+        inventory_rollups = DailyInventoryRollup.objects.filter(
+            product__provider=user
+        ).filter(rollups_filter)
+    else:
+        products = Product.objects.filter(is_deleted=False)
+        transactions = InventoryTransaction.objects.filter(date_filter)
+        inventory_rollups = DailyInventoryRollup.objects.filter(rollups_filter)
+    
+    context = {
+        'user': user,
+        'generated_at': timezone.now(),
+        'date_from': date_from,
+        'date_to': date_to if date_to else timezone.now(),
+    }
+    
+    if report_type == 'transactions':
+        context['report_title'] = 'Inventory Transaction Report'
+        # Summaries read the daily rollups for closed days and the ledger for today
+        totals = inventory_totals(inventory_rollups, transactions)
+        context['transactions'] = report_section(
+            transactions.order_by('-timestamp', '-id').values(
+                'timestamp', 'product__name', 'transaction_type', 'quantity', 'notes', 'performed_by__username'
+            ),
+            totals['transaction_count']
+        )
+        totals['initial_count'] = totals['transaction_count'] - sum(
+            totals[f'{transaction_type}_count'] for transaction_type in ('add', 'remove', 'adjust')
+        )
+        totals['initial_quantity'] = totals['total_quantity'] - sum(
+            totals[f'{transaction_type}_quantity'] for transaction_type in ('add', 'remove', 'adjust')
+        )
+        context['transaction_summary'] = [
+            {
+                'transaction_type': transaction_type,
+                'count': totals[f'{transaction_type}_count'],
+                'total_quantity': totals[f'{transaction_type}_quantity'],
+            }
+            for transaction_type in ('add', 'remove', 'adjust', 'initial')
+            if totals[f'{transaction_type}_count']
+        ]
+        
+        product_transactions = [
+            {
+                'product__name': name,
+                'count': product_totals['transaction_count'],
+                'total_quantity': product_totals['total_quantity'],
+                'additions': product_totals['add_quantity'],
+                'removals': abs(product_totals['remove_quantity']),
+                'net_change': product_totals['add_quantity'] - abs(product_totals['remove_quantity']),
+            }
+            for name, product_totals in inventory_totals_by_product(inventory_rollups, transactions).items()
+        ]
+        context['product_transactions'] = sorted(product_transactions, key=lambda item: -item['count'])
+        
+        template_name = 'inventory/transaction_report.html'
+    
+    elif report_type == 'low_stock':
+        low_stock_products = products.filter(stock__lte=settings.LOW_STOCK_THRESHOLD)
+        context['report_title'] = 'Low Stock Report'
+        context['threshold'] = settings.LOW_STOCK_THRESHOLD
+        
+        stock_levels = low_stock_products.values('stock').annotate(
+            count=Count('id')
+        ).order_by('stock')
+        context['stock_levels'] = list(stock_levels)
+        context['low_stock_count'] = sum(level['count'] for level in context['stock_levels'])
+        context['low_stock_products'] = report_section(
+            low_stock_products.order_by('stock', 'id').values(
+                'name', 'type', 'stock', 'is_active', 'provider__username'
+            ),
+            context['low_stock_count']
+        )
+        context['out_of_stock'] = next(
+            (level['count'] for level in context['stock_levels'] if level['stock'] == 0), 0
+        )
+        
+        template_name = 'inventory/low_stock_report.html'
+    
+    else:
+        context['report_title'] = 'Inventory Status Report'
+        context['inventory_summary'] = products.aggregate(
+            total_products=Count('id'),
+            active_products=Count('id', filter=Q(is_active=True)),
+            low_stock_products=Count('id', filter=Q(stock__lte=settings.LOW_STOCK_THRESHOLD)),
+            out_of_stock_products=Count('id', filter=Q(stock=0)),
+        )
+        
+        product_types = products.values('type').annotate(
+            count=Count('id'),
+            total_stock=Sum('stock')
+        ).order_by('type')
+        context['product_types'] = list(product_types)
+        context['products'] = report_section(
+            products.order_by('name', 'id').values('name', 'type', 'stock', 'is_active'),
+            context['inventory_summary']['total_products']
+        )
+        
+        template_name = 'inventory/inventory_report.html'
+    
+    return template_name, context
+
+
+def report_data_version(user, report_type):
+    # Read from the database, so writes made by any process (the job worker,
+    # the event consumer) retire cached reports. Products are aggregated within
+    # the user's scope only. The ledger is append only, so its newest id is
+    # enough and comes straight from the primary key index.
+    products = Product.objects.filter(provider=user) if user.role == 'supplier' else Product.objects.all()
+    version = products.aggregate(products=Count('id'), last_update=Max('last_update'))
+    parts = [str(version['products']), str(version['last_update'])]
+    if report_type == 'transactions':
+        last_transaction = InventoryTransaction.objects.order_by('-id').values_list('id', flat=True).first()
+        parts.append(str(last_transaction or 0))
+    return ':'.join(parts)
+
+
+def report_cache_key(user, params):
+    report_type = params.get('type', 'inventory')
+    scope = f"supplier:{user.id}" if user.role == 'supplier' else 'all'
+    parts = [
+        scope, report_type, params.get('date_from') or '', params.get('date_to') or '',
+        report_data_version(user, report_type),
+    ]
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return f"inventory:report:pdf:{digest}"
+
+
+def render_inventory_report(user, params):
+    template_name, context = build_inventory_report(user, params)
+    return render_to_string(template_name, context)
+
+
+def render_inventory_report_pdf(user, params):
+    # A report is rendered once per scope, type, period and data version;
+    # repeated downloads are served from the cache.
+    key = report_cache_key(user, params)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = render_pdf(render_inventory_report(user, params))
+        cache.set(key, pdf, settings.REPORT_CACHE_TIMEOUT)
+    return pdf
@@ -0,0 +1,167 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Sum, Q, F
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import InventoryTransaction, PriceChangeLog, DailyInventoryRollup, DailyPriceRollup
+
+# Rollups hold one row per product and local calendar day. Closed days are
+# read from them; the current day is always read from the raw tables, so
+# readers never depend on the consumer having caught up with today.
+
+INVENTORY_TYPES = ('add', 'remove', 'adjust')
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def inventory_aggregates():
+    aggregates = {
+        'transaction_count': Count('id'),
+        'total_quantity': Coalesce(Sum('quantity'), 0),
+    }
+    for transaction_type in INVENTORY_TYPES:
+        aggregates[f'{transaction_type}_count'] = Count('id', filter=Q(transaction_type=transaction_type))
+        aggregates[f'{transaction_type}_quantity'] = Coalesce(
+            Sum('quantity', filter=Q(transaction_type=transaction_type)), 0
+        )
+    return aggregates
+
+
+def price_aggregates():
+    increase = Q(new_price__gt=F('old_price'))
+    decrease = Q(new_price__lt=F('old_price'))
+    return {
+        'change_count': Count('id'),
+        'increase_count': Count('id', filter=increase),
+        'increase_total': Coalesce(Sum(F('new_price') - F('old_price'), filter=increase), 0),
+        'decrease_count': Count('id', filter=decrease),
+        'decrease_total': Coalesce(Sum(F('old_price') - F('new_price'), filter=decrease), 0),
+    }
+
+
+def _write_rollups(rollup_model, rows, time_field, aggregates, closing_field, closing_target, keys=None):
+    # Buckets are recomputed from the raw rows and upserted, which keeps the
+    # refresh idempotent when events are replayed.
+    rows = rows.annotate(day=TruncDate(time_field)).order_by()
+    closing = {
+        (product_id, day): value
+        for product_id, day, value in rows
+        .order_by('product_id', 'day', f'-{time_field}', '-id')
+        .distinct('product_id', 'day')
+        .values_list('product_id', 'day', closing_field)
+    }
+
+    rollups = []
+    for bucket in rows.values('product_id', 'day').annotate(**aggregates):
+        key = (bucket['product_id'], bucket['day'])
+        if keys is not None and key not in keys:
+            continue
+        bucket[closing_target] = closing.get(key)
+        rollups.append(rollup_model(**bucket))
+
+    rollup_model.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['product', 'day'],
+        update_fields=[*aggregates.keys(), closing_target],
+        batch_size=1000
+    )
+    return len(rollups)
+
+
+def _bucket_rows(model, time_field, keys):
+    days = [day for _, day in keys]
+    return model.objects.filter(**{
+        'product_id__in': {product_id for product_id, _ in keys},
+        f'{time_field}__gte': day_start(min(days)),
+        f'{time_field}__lt': day_start(max(days) + timedelta(days=1)),
+    })
+
+
+def _range_rows(model, time_field, date_from=None, date_to=None):
+    rows = model.objects.all()
+    if date_from:
+        rows = rows.filter(**{f'{time_field}__gte': day_start(date_from)})
+    if date_to:
+        rows = rows.filter(**{f'{time_field}__lt': day_start(date_to + timedelta(days=1))})
+    return rows
+
+
+def refresh_inventory_rollups(keys):
+    keys = set(keys)
+    if not keys:
+        return 0
+    rows = _bucket_rows(InventoryTransaction, 'timestamp', keys)
+    return _write_rollups(DailyInventoryRollup, rows, 'timestamp', inventory_aggregates(),
+                          'new_stock', 'closing_stock', keys)
+
+
+def refresh_price_rollups(keys):
+    keys = set(keys)
+    if not keys:
+        return 0
+    rows = _bucket_rows(PriceChangeLog, 'changed_at', keys)
+    return _write_rollups(DailyPriceRollup, rows, 'changed_at', price_aggregates(),
+                          'new_price', 'closing_price', keys)
+
+
+def rebuild_inventory_rollups(date_from=None, date_to=None):
+    rows = _range_rows(InventoryTransaction, 'timestamp', date_from, date_to)
+    return _write_rollups(DailyInventoryRollup, rows, 'timestamp', inventory_aggregates(),
+                          'new_stock', 'closing_stock')
+
+
+def rebuild_price_rollups(date_from=None, date_to=None):
+    rows = _range_rows(PriceChangeLog, 'changed_at', date_from, date_to)
+    return _write_rollups(DailyPriceRollup, rows, 'changed_at', price_aggregates(),
+                          'new_price', 'closing_price')
+
+
+def touched_buckets(model, time_field, event_ids):
+    return set(
+        model.objects
+        .filter(event_id__in=event_ids)
+        .order_by()
+        .annotate(day=TruncDate(time_field))
+        .values_list('product_id', 'day')
+        .distinct()
+    )
+
+
+def _sum_fields(fields):
+    return {field: Coalesce(Sum(field), 0) for field in fields}
+
+
+def _combine(closed, live):
+    return {field: closed[field] + live[field] for field in closed}
+
+
+def inventory_totals(rollups, transactions):
+    # rollups and transactions are already scoped to the same products and
+    # date range; closed days come from the former, today from the latter.
+    today = timezone.localdate()
+    aggregates = inventory_aggregates()
+    closed = rollups.filter(day__lt=today).aggregate(**_sum_fields(aggregates))
+    live = transactions.filter(timestamp__gte=day_start(today)).aggregate(**aggregates)
+    return _combine(closed, live)
+
+
+def inventory_totals_by_product(rollups, transactions):
+    today = timezone.localdate()
+    aggregates = inventory_aggregates()
+    totals = {}
+    closed = rollups.filter(day__lt=today).values('product__name').annotate(**_sum_fields(aggregates))
+    live = transactions.filter(timestamp__gte=day_start(today)).values('product__name').annotate(**aggregates)
+    for row in [*closed.order_by(), *live.order_by()]:
+        name = row.pop('product__name')
+        totals[name] = _combine(totals[name], row) if name in totals else row
+    return totals
+
+
+def price_totals(rollups, price_changes):
+    today = timezone.localdate()
+    aggregates = price_aggregates()
+    closed = rollups.filter(day__lt=today).aggregate(**_sum_fields(aggregates))
+    live = price_changes.filter(changed_at__gte=day_start(today)).aggregate(**aggregates)
+    return _combine(closed, live)
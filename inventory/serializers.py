@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from core.models import Product
-from .models import InventoryTransaction, LowStockAlert, PriceChangeLog
+from django.urls import reverse
+from .models import InventoryTransaction, LowStockAlert, PriceChangeLog, Job
 
 class ProductInventorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -59,4 +60,20 @@ class PriceUpdateSerializer(serializers.Serializer):
 class BulkPriceUpdateSerializer(serializers.Serializer):
     product_ids = serializers.ListField(child=serializers.IntegerField())
     new_price = serializers.IntegerField(min_value=0)
-    notes = serializers.CharField(required=False, allow_blank=True) 
\ No newline at end of file
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+class JobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'progress', 'result', 'error', 'download_url',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+    
+    def get_download_url(self, obj):
+        if not obj.artefact:
+            return None
+        url = reverse('inventory-jobs-download', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
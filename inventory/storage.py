@@ -0,0 +1,28 @@
+import os
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class PrivateStorage(FileSystemStorage):
+    # Files under PRIVATE_MEDIA_ROOT are never served by URL, only streamed
+    # back by views that check who is asking.
+    @property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError("Private files have no public URL.")
+
+
+def job_source_path(instance, filename):
+    return f'jobs/{instance.id}/source/{os.path.basename(filename)}'
+
+
+def job_artefact_path(instance, filename):
+    return f'jobs/{instance.id}/artefact/{os.path.basename(filename)}'
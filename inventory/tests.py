@@ -1,3 +1,791 @@
-from django.test import TestCase
+import io
+import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import uuid
+import tempfile
+import openpyxl
+from datetime import timedelta
+from django.test import TestCase, TransactionTestCase
+from django.db import OperationalError, connection
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.conf import settings
+from core.models import CustomUser, Product, Package
+from django.utils import timezone
+from django.core.management import call_command
+from .models import (
+    InventoryTransaction, LowStockAlert, PriceChangeLog, EventOutbox, DailyInventoryRollup, Job
+)
+from . import kafka_utils
+from .jobs import run_job
+from .reports import report_cache_key
+from .management.commands.process_inventory_events import Command
 
-# Create your tests here.
+
+class InventoryTestCase(TestCase):
+    def setUp(self):
+        self.supplier = CustomUser.objects.create_user(
+            username="supplier", password="12345678", role="supplier"
+        )
+        self.client.force_login(self.supplier)
+
+    def create_product(self, **kwargs):
+        fields = {
+            "provider": self.supplier,
+            "name": "diaper",
+            "type": "sanitary",
+            "price": 100,
+            "stock": 50,
+            "is_active": True,
+        }
+        fields.update(kwargs)
+        return Product.objects.create(**fields)
+
+
+class StockUpdateTests(InventoryTestCase):
+    def test_update_stock_writes_outbox_event(self):
+        product = self.create_product(stock=12)
+        response = self.client.post(
+            reverse("update-stock"),
+            {"product_id": product.id, "quantity": 5, "transaction_type": "remove"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["new_stock"], 7)
+        self.assertEqual(InventoryTransaction.objects.filter(product=product).count(), 1)
+
+        topics = list(EventOutbox.objects.values_list("topic", flat=True))
+        self.assertEqual(topics, [
+            settings.KAFKA_TOPICS["INVENTORY_UPDATES"],
+            settings.KAFKA_TOPICS["LOW_STOCK_ALERTS"],
+        ])
+        event = EventOutbox.objects.first()
+        self.assertEqual(event.payload["new_stock"], 7)
+        # The ledger row shares the event id, so the consumer will not duplicate it
+        self.assertEqual(
+            str(InventoryTransaction.objects.get(product=product).event_id),
+            event.payload["event_id"]
+        )
+
+    def test_rejected_update_leaves_no_event(self):
+        product = self.create_product(stock=3)
+        response = self.client.post(
+            reverse("update-stock"),
+            {"product_id": product.id, "quantity": 5, "transaction_type": "remove"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(EventOutbox.objects.exists())
+
+
+    def test_update_stock_is_one_conditional_statement(self):
+        product = self.create_product(stock=12)
+        other = CustomUser.objects.create_user(username="other", password="12345678", role="supplier")
+        foreign = self.create_product(provider=other)
+        url = reverse("update-stock")
+
+        # session, user, savepoint, stock update, ledger, package stock, outbox, release
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                url, {"product_id": product.id, "quantity": 30, "transaction_type": "adjust"},
+                content_type="application/json",
+            )
+        self.assertEqual((response.json()["previous_stock"], response.json()["new_stock"]), (12, 30))
+        self.assertEqual(InventoryTransaction.objects.get(product=product).quantity, 18)
+
+        response = self.client.post(
+            url, {"product_id": foreign.id, "quantity": 1, "transaction_type": "remove"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Product.objects.get(id=foreign.id).stock, 50)
+
+
+class KafkaProducerTests(TestCase):
+    def setUp(self):
+        for name in ("_producer", "_producer_pid", "_poll_thread", "_poll_stop"):
+            patcher = mock.patch.object(kafka_utils, name, getattr(kafka_utils, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        kafka_utils._producer = None
+        # Stops the poll thread of whichever producer the test started
+        self.addCleanup(lambda: kafka_utils._poll_stop.set())
+
+        patcher = mock.patch(f"{kafka_utils.__name__}.Producer")
+        self.Producer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.Producer.side_effect = lambda config: self.new_producer()
+
+    def new_producer(self):
+        producer = mock.Mock()
+        producer.poll.side_effect = lambda timeout: time.sleep(0.01)
+        return producer
+
+    def test_producer_is_reused_within_a_process(self):
+        producer = kafka_utils.get_kafka_producer()
+        self.assertIs(kafka_utils.get_kafka_producer(), producer)
+        self.assertEqual(self.Producer.call_count, 1)
+
+    def test_forked_process_gets_its_own_producer(self):
+        parent = kafka_utils.get_kafka_producer()
+        self.addCleanup(kafka_utils._poll_stop.set)
+        # As seen from a child, the producer belongs to another process
+        kafka_utils._producer_pid = os.getpid() + 1
+        self.assertEqual(kafka_utils.flush_kafka_producer(), 0)
+        parent.flush.assert_not_called()
+
+        child = kafka_utils.get_kafka_producer()
+        self.assertIsNot(child, parent)
+        self.assertEqual(kafka_utils._producer_pid, os.getpid())
+
+    def test_full_queue_is_polled_and_produce_retried(self):
+        producer = kafka_utils.get_kafka_producer()
+        producer.produce.side_effect = [BufferError, None]
+        with self.assertLogs(kafka_utils.__name__, level="WARNING"):
+            kafka_utils.produce_message("inventory-updates", 7, {"product_id": 7})
+
+        self.assertEqual(producer.produce.call_count, 2)
+        producer.poll.assert_any_call(1.0)
+        self.assertEqual(producer.produce.call_args.kwargs["key"], b"7")
+
+    def test_flush_reports_undelivered_messages(self):
+        producer = kafka_utils.get_kafka_producer()
+        producer.flush.return_value = 3
+        with self.assertLogs(kafka_utils.__name__, level="ERROR") as logs:
+            self.assertEqual(kafka_utils.flush_kafka_producer(timeout=2), 3)
+        producer.flush.assert_called_once_with(2)
+        self.assertIn("3 Kafka message(s) were not delivered", logs.output[0])
+
+
+class OutboxRelayTests(InventoryTestCase):
+    relay_module = "inventory.management.commands.relay_outbox_events"
+
+    def relay(self, *args, fail=(), on_flush=None, late_callbacks=False):
+        # Stands in for the producer: every produced message is acknowledged on
+        # flush, as an error for the entries whose key is in fail. With
+        # late_callbacks the acknowledgements arrive from another thread just
+        # after flush returned, as they can from the producer's poll thread.
+        pending = []
+        produced = []
+
+        def produce(topic, key, payload, callback):
+            pending.append((key, callback))
+            produced.append(payload)
+
+        def acknowledge(callbacks):
+            if late_callbacks:
+                time.sleep(0.05)
+            for key, callback in callbacks:
+                callback("broker unavailable" if key in fail else None, None)
+
+        def flush():
+            if on_flush is not None:
+                on_flush()
+            callbacks = list(pending)
+            pending.clear()
+            if late_callbacks:
+                threading.Thread(target=acknowledge, args=(callbacks,)).start()
+            else:
+                acknowledge(callbacks)
+            return 0
+
+        with mock.patch(f"{self.relay_module}.produce_message", side_effect=produce), \
+                mock.patch(f"{self.relay_module}.flush_kafka_producer", side_effect=flush):
+            call_command("relay_outbox_events", "--once", *args, stdout=io.StringIO())
+        return produced
+
+    def create_events(self, *keys):
+        return [
+            EventOutbox.objects.create(topic="inventory-updates", key=key, payload={"key": key, "index": index})
+            for index, key in enumerate(keys)
+        ]
+
+    def test_events_are_claimed_before_publishing_and_marked_after(self):
+        first, second = self.create_events("1", "2")
+        outer_blocks = len(connection.atomic_blocks)
+        during_flush = {}
+
+        def on_flush():
+            # The relay flushes once more on exit, only the batch flush matters
+            if not during_flush:
+                during_flush["atomic_blocks"] = len(connection.atomic_blocks)
+                during_flush["claimed"] = EventOutbox.objects.filter(claimed_until__isnull=False).count()
+
+        self.relay(fail={"2"}, on_flush=on_flush)
+        # Nothing is locked while waiting on the broker, the claims are leases
+        self.assertEqual(during_flush, {"atomic_blocks": outer_blocks, "claimed": 2})
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNotNone(first.published_at)
+        self.assertIsNone(first.claimed_until)
+        self.assertIsNone(second.published_at)
+        self.assertIsNone(second.claimed_until)
+        self.assertEqual((second.attempts, second.last_error), (1, "broker unavailable"))
+
+    def test_event_is_parked_after_max_attempts(self):
+        event, = self.create_events("1")
+        with self.assertLogs(self.relay_module, level="ERROR"):
+            for _ in range(2):
+                self.relay("--max-attempts", "2", fail={"1"})
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.dead_at)
+
+        # A dead event is not offered to the producer again
+        self.relay()
+        event.refresh_from_db()
+        self.assertIsNone(event.published_at)
+        self.assertEqual(event.attempts, 2)
+
+    def test_failed_event_holds_back_later_events_of_its_key(self):
+        failed, later, other = self.create_events("1", "1", "2")
+        produced = self.relay(fail={"1"})
+        self.assertEqual([payload["index"] for payload in produced], [0, 2])
+
+        later.refresh_from_db()
+        self.assertIsNone(later.published_at)
+        self.assertIsNone(later.claimed_until)
+        self.assertEqual(later.attempts, 0)
+        self.assertEqual(EventOutbox.objects.get(pk=failed.pk).attempts, 1)
+        self.assertIsNotNone(EventOutbox.objects.get(pk=other.pk).published_at)
+
+        # Once the first event goes through, the next one follows it
+        self.assertEqual([payload["index"] for payload in self.relay()], [0, 1])
+
+    def test_event_leased_elsewhere_holds_back_later_events_of_its_key(self):
+        in_flight, later = self.create_events("1", "1")
+        EventOutbox.objects.filter(pk=in_flight.pk).update(claimed_until=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(self.relay(), [])
+
+    def test_deliveries_reported_after_flush_are_waited_for(self):
+        event, = self.create_events("1")
+        self.relay(late_callbacks=True)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.published_at)
+        self.assertEqual(event.attempts, 0)
+
+    def test_only_expired_claims_are_taken_over(self):
+        abandoned, in_flight = self.create_events("1", "2")
+        EventOutbox.objects.filter(pk=abandoned.pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        EventOutbox.objects.filter(pk=in_flight.pk).update(claimed_until=timezone.now() + timedelta(minutes=5))
+
+        self.relay()
+        abandoned.refresh_from_db()
+        in_flight.refresh_from_db()
+        self.assertIsNotNone(abandoned.published_at)
+        self.assertIsNone(in_flight.published_at)
+
+
+class InventoryEventBatchTests(InventoryTestCase):
+    def test_inventory_update_batch_dedups_and_alerts(self):
+        first = self.create_product(stock=20)
+        second = self.create_product(stock=20)
+        replayed_id = str(uuid.uuid4())
+        messages = [
+            {"event_id": replayed_id, "product_id": first.id, "old_stock": 20, "new_stock": 25, "user_id": self.supplier.id},
+            {"event_id": replayed_id, "product_id": first.id, "old_stock": 20, "new_stock": 25, "user_id": self.supplier.id},
+            {"event_id": str(uuid.uuid4()), "product_id": second.id, "old_stock": 20, "new_stock": 5, "user_id": None},
+            {"event_id": str(uuid.uuid4()), "product_id": second.id, "old_stock": 5, "new_stock": 2, "user_id": None},
+            {"event_id": str(uuid.uuid4()), "product_id": 999999, "old_stock": 1, "new_stock": 2, "user_id": None},
+        ]
+
+        command = Command(stdout=io.StringIO())
+        # savepoint, products, users, ledger, touched days, closing stock,
+        # day totals, rollup upsert, open alerts, new alerts, release
+        with self.assertNumQueries(11):
+            command.process_inventory_update_batch(messages)
+        # Replaying the whole batch later must not duplicate ledger rows
+        command.process_inventory_update_batch(messages)
+
+        self.assertEqual(InventoryTransaction.objects.filter(product=first).count(), 1)
+        self.assertEqual(InventoryTransaction.objects.filter(product=second).count(), 2)
+        alert = LowStockAlert.objects.get(product=second)
+        self.assertEqual(alert.stock_level, 5)
+        rollup = DailyInventoryRollup.objects.get(product=second)
+        self.assertEqual((rollup.remove_count, rollup.remove_quantity, rollup.closing_stock), (2, 18, 2))
+
+
+    def consume_one_batch(self, command, messages):
+        consumer = mock.MagicMock()
+
+        def consume(**kwargs):
+            command.stop_requested.set()
+            return messages
+
+        consumer.consume.side_effect = consume
+        command.batch_size = len(messages)
+        command.batch_timeout = 0
+        command.stop_requested = threading.Event()
+        with mock.patch(f"{Command.__module__}.Consumer", return_value=consumer):
+            command.process_topic_in_batches(settings.KAFKA_TOPICS["INVENTORY_UPDATES"])
+        return consumer
+
+    def kafka_message(self, offset, value):
+        msg = mock.MagicMock()
+        msg.error.return_value = None
+        msg.value.return_value = json.dumps(value).encode("utf-8")
+        msg.topic.return_value = settings.KAFKA_TOPICS["INVENTORY_UPDATES"]
+        msg.partition.return_value = 0
+        msg.offset.return_value = offset
+        return msg
+
+    def test_unstored_batch_is_rewound_instead_of_committed(self):
+        product = self.create_product(stock=20)
+        messages = [
+            self.kafka_message(offset, {"product_id": product.id, "old_stock": 20, "new_stock": 19})
+            for offset in (5, 6)
+        ]
+        command = Command(stdout=io.StringIO())
+        with mock.patch.object(command, "process_inventory_update_batch", side_effect=OperationalError("down")), \
+                mock.patch.object(command, "process_message", side_effect=OperationalError("down")), \
+                self.assertLogs(Command.__module__, level="ERROR"):
+            consumer = self.consume_one_batch(command, messages)
+
+        consumer.commit.assert_not_called()
+        (partition,), _ = consumer.seek.call_args
+        self.assertEqual((partition.partition, partition.offset), (0, 5))
+
+    def test_stored_batch_commits_offsets(self):
+        product = self.create_product(stock=20)
+        command = Command(stdout=io.StringIO())
+        consumer = self.consume_one_batch(
+            command, [self.kafka_message(5, {"product_id": product.id, "old_stock": 20, "new_stock": 19})]
+        )
+        consumer.commit.assert_called_once()
+        consumer.seek.assert_not_called()
+        self.assertEqual(InventoryTransaction.objects.filter(product=product).count(), 1)
+
+
+class ConsumerWorkerTests(TestCase):
+    def test_workers_close_connections_and_build_their_consumer_after_fork(self):
+        module = Command.__module__
+        events = []
+
+        class FakeProcess:
+            # Runs the worker inline when started, standing in for the child
+            def __init__(self, target, args, name):
+                self.target, self.args, self.name = target, args, name
+                self.pid, self.exitcode = 0, 0
+
+            def start(self):
+                events.append("fork")
+                self.target.__self__.stop_requested.set()
+                self.target(*self.args)
+
+            def join(self):
+                pass
+
+        context = mock.Mock(Process=FakeProcess)
+        with mock.patch(f"{module}.connections") as connections, \
+                mock.patch(f"{module}.multiprocessing") as multiprocessing, \
+                mock.patch(f"{module}.signal"), \
+                mock.patch(f"{module}.Consumer") as consumer:
+            connections.close_all.side_effect = lambda: events.append("close connections")
+            multiprocessing.get_context.return_value = context
+            consumer.side_effect = lambda config: events.append("consumer") or mock.MagicMock()
+            call_command(
+                "process_inventory_events", "--workers", "2",
+                "--topic", settings.KAFKA_TOPICS["INVENTORY_UPDATES"], stdout=io.StringIO()
+            )
+
+        multiprocessing.get_context.assert_called_once_with("fork")
+        self.assertEqual(events, [
+            "close connections",
+            "fork", "consumer", "close connections",
+            "fork", "consumer", "close connections",
+        ])
+
+
+class BulkStockUpdateTests(InventoryTestCase):
+    def test_bulk_update_stock_runs_in_constant_queries(self):
+        products = [self.create_product(stock=stock) for stock in (1, 20, 30, 40)]
+        other = CustomUser.objects.create_user(username="other", password="12345678", role="supplier")
+        foreign = self.create_product(provider=other)
+
+        payload = {
+            "product_ids": [product.id for product in products] + [foreign.id],
+            "quantity": 5,
+            "transaction_type": "remove",
+        }
+        # session, user, savepoint, lock, bulk update, package stock, ledger, outbox, release
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse("bulk-update-stock"), payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([item["new_stock"] for item in results["successful"]], [15, 25, 35])
+        self.assertEqual(
+            [item["product_id"] for item in results["failed"]],
+            [products[0].id, foreign.id]
+        )
+        self.assertEqual(Product.objects.get(id=products[1].id).stock, 15)
+        self.assertEqual(InventoryTransaction.objects.count(), 3)
+        self.assertEqual(EventOutbox.objects.filter(topic=settings.KAFKA_TOPICS["INVENTORY_UPDATES"]).count(), 3)
+
+
+class BulkPriceUpdateTests(InventoryTestCase):
+    def test_bulk_update_price_recomputes_each_package_once(self):
+        first = self.create_product(price=100)
+        second = self.create_product(price=200)
+        unchanged = self.create_product(price=50)
+        package = Package.objects.create(name="newborn box")
+        package.products.add(first, second, unchanged)
+
+        payload = {"product_ids": [first.id, second.id, unchanged.id], "new_price": 50}
+        # session, user, savepoint, lock, price update, package totals, log, outbox, release
+        with self.assertNumQueries(9):
+            response = self.client.post(reverse("bulk-update-price"), payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]["successful"]), 3)
+        package.refresh_from_db()
+        self.assertEqual(package.total_price, 150)
+        self.assertEqual(PriceChangeLog.objects.count(), 2)
+
+
+class TransactionPaginationTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        product = self.create_product()
+        now = timezone.now()
+        # Two rows share a timestamp to exercise the id tie-breaker
+        for offset in (0, 1, 1, 2, 3):
+            InventoryTransaction.objects.create(
+                product=product, quantity=1, previous_stock=1, new_stock=2,
+                transaction_type="add", performed_by=self.supplier,
+                timestamp=now - timedelta(minutes=offset)
+            )
+
+    def test_cursor_pagination_is_opt_in(self):
+        url = reverse("inventory-transactions-list")
+        self.assertEqual(len(self.client.get(url).json()), 5)
+
+        seen = []
+        response = self.client.get(url, {"pagination": "cursor", "page_size": 2}).json()
+        while True:
+            seen.extend(item["id"] for item in response["results"])
+            if not response["next"]:
+                break
+            response = self.client.get(response["next"]).json()
+
+        expected = list(
+            InventoryTransaction.objects.order_by("-timestamp", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+
+class ProductConditionalGetTests(InventoryTestCase):
+    def test_product_etag_changes_with_stock(self):
+        product = self.create_product()
+        url = reverse("inventory-products-detail", args=[product.id])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(
+            reverse("update-stock"),
+            {"product_id": product.id, "quantity": 5, "transaction_type": "add"},
+            content_type="application/json",
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stock"], 55)
+
+    def test_malformed_product_id_is_not_found(self):
+        self.assertEqual(self.client.get("/api/inventory/products/abc/").status_code, 404)
+
+
+class DashboardTests(InventoryTestCase):
+    def test_dashboard_runs_constant_queries(self):
+        for stock in (0, 5, 40):
+            product = self.create_product(stock=stock)
+            InventoryTransaction.objects.create(
+                product=product, quantity=3, previous_stock=stock, new_stock=stock + 3,
+                transaction_type="add", performed_by=self.supplier
+            )
+            InventoryTransaction.objects.create(
+                product=product, quantity=-1, previous_stock=stock + 3, new_stock=stock + 2,
+                transaction_type="remove", performed_by=self.supplier
+            )
+            LowStockAlert.objects.create(product=product, stock_level=stock, threshold=10)
+            PriceChangeLog.objects.create(product=product, old_price=100, new_price=120, changed_by=self.supplier)
+
+        # Older days are read from the rollups
+        InventoryTransaction.objects.create(
+            product=product, quantity=7, previous_stock=0, new_stock=7, transaction_type="add",
+            timestamp=timezone.now() - timedelta(days=3)
+        )
+        call_command("rebuild_inventory_rollups", stdout=io.StringIO())
+        InventoryTransaction.objects.filter(quantity=7).delete()
+
+        # session, user, products, closed and live transaction totals, alerts,
+        # closed and live price totals, three recent lists
+        with self.assertNumQueries(11):
+            response = self.client.get(reverse("inventory-dashboard"))
+        data = response.json()
+        self.assertEqual(data["product_stats"], {
+            "total_products": 3, "active_products": 3, "low_stock_products": 2, "out_of_stock_products": 1,
+        })
+        self.assertEqual(data["transaction_stats"]["add_transactions"], {"count": 4, "total_quantity": 16})
+        self.assertEqual(data["transaction_stats"]["remove_transactions"], {"count": 3, "total_quantity": -3})
+        self.assertEqual(data["alert_stats"]["pending_alerts"], 3)
+        self.assertEqual(data["price_stats"]["avg_price_increase"], 20)
+        self.assertEqual(len(data["recent_data"]["transactions"]), 6)
+
+
+class ExportInventoryTests(InventoryTestCase):
+    def test_csv_export_streams_rows_in_constant_queries(self):
+        for name in ("wipes", "bottle", "pacifier"):
+            self.create_product(name=name)
+        other = CustomUser.objects.create_user(username="other", password="12345678", role="supplier")
+        self.create_product(provider=other)
+
+        response = self.client.get(reverse("export-inventory"))
+        self.assertTrue(response.streaming)
+        # Rows are only read once the body is consumed: one query for all of them
+        with self.assertNumQueries(1):
+            body = b"".join(response.streaming_content).decode("utf-8")
+
+        lines = body.splitlines()
+        self.assertEqual(lines[0], "ID,Name,Type,Price,Stock,Active,Provider")
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(all(line.endswith(",Yes,supplier") for line in lines[1:]))
+
+    def test_excel_export_marks_low_stock_rows(self):
+        self.create_product(name="wipes", stock=0)
+        self.create_product(name="bottle", stock=5)
+        self.create_product(name="pacifier", stock=40)
+
+        response = self.client.get(reverse("export-inventory"), {"format": "excel"})
+        self.assertEqual(response.status_code, 200)
+        ws = openpyxl.load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        rows = list(ws.iter_rows(min_row=2))
+        self.assertEqual([row[1].value for row in rows], ["wipes", "bottle", "pacifier"])
+        self.assertEqual(
+            [row[0].fill.start_color.rgb for row in rows],
+            ["00FF0000", "00FFFF00", "00000000"]
+        )
+
+
+class ImportInventoryTests(InventoryTestCase):
+    def upload(self, name, content):
+        return self.client.post(reverse("import-inventory"), {"file": SimpleUploadedFile(name, content)})
+
+    def test_csv_import_applies_batch_in_one_transaction(self):
+        products = [self.create_product(stock=10) for _ in range(3)]
+        other = CustomUser.objects.create_user(username="other", password="12345678", role="supplier")
+        foreign = self.create_product(provider=other)
+        rows = [
+            "ID,Name,Type,Price,Stock,Active,Provider",
+            f"{products[0].id},diaper,sanitary,100,4,Yes,supplier",
+            f"{products[1].id},diaper,sanitary,100,10,Yes,supplier",
+            f"{products[2].id},diaper,sanitary,100,3,Yes,supplier",
+            f"{products[2].id},diaper,sanitary,100,30,Yes,supplier",
+            f"{foreign.id},diaper,sanitary,100,1,Yes,other",
+            f"{products[1].id},diaper,sanitary,100,many,Yes,supplier",
+            "",
+        ]
+        # session, user, savepoint, lock, bulk update, package stock, ledger, outbox, release
+        with self.assertNumQueries(9):
+            response = self.upload("stock.csv", "\n".join(rows).encode("utf-8"))
+
+        results = response.json()["results"]
+        self.assertEqual(len(results["successful"]), 3)
+        self.assertEqual([item["product_id"] for item in results["failed"]], [str(products[1].id), foreign.id])
+        self.assertEqual(
+            list(Product.objects.filter(id__in=[p.id for p in products]).order_by("id").values_list("stock", flat=True)),
+            [4, 10, 30]
+        )
+        # The unchanged product gets no ledger row
+        self.assertEqual(InventoryTransaction.objects.count(), 2)
+        self.assertEqual(InventoryTransaction.objects.get(product=products[0]).quantity, -6)
+        # Inventory update for both, plus a low stock alert for the product at 4
+        self.assertEqual(EventOutbox.objects.count(), 3)
+
+    def test_xlsx_import_reads_stock_column(self):
+        product = self.create_product(stock=10)
+        wb = openpyxl.Workbook()
+        wb.active.append(["ID", "Name", "Type", "Price", "Stock", "Active", "Provider"])
+        wb.active.append([product.id, "diaper", "sanitary", 100, 25, "Yes", "supplier"])
+        content = io.BytesIO()
+        wb.save(content)
+
+        response = self.upload("stock.xlsx", content.getvalue())
+        self.assertEqual(response.json()["results"]["successful"][0]["new_stock"], 25)
+        self.assertEqual(InventoryTransaction.objects.get(product=product).notes, "Imported from Excel")
+
+
+class InventoryJobTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(
+            MEDIA_ROOT=os.path.join(media_root.name, "public"),
+            PRIVATE_MEDIA_ROOT=os.path.join(media_root.name, "private"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_async_import_runs_in_worker(self):
+        product = self.create_product(stock=10)
+        content = f"ID,Name,Type,Price,Stock,Active,Provider\n{product.id},diaper,sanitary,100,25,Yes,supplier\n"
+        response = self.client.post(
+            reverse("import-inventory") + "?async=1",
+            {"file": SimpleUploadedFile("stock.csv", content.encode("utf-8"))}
+        )
+        self.assertEqual(response.status_code, 202)
+        job_url = response.json()["status_url"]
+        self.assertEqual(Product.objects.get(id=product.id).stock, 10)
+
+        call_command("run_inventory_jobs", "--once", stdout=io.StringIO())
+
+        data = self.client.get(job_url).json()
+        self.assertEqual((data["status"], data["progress"]), ("succeeded", 100))
+        self.assertEqual(data["result"]["successful"][0]["new_stock"], 25)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 25)
+        self.assertFalse(Job.objects.get().source)
+
+    def test_async_export_artefact_is_private(self):
+        self.create_product(name="wipes")
+        response = self.client.get(reverse("export-inventory"), {"async": "1"})
+        job_id = response.json()["job_id"]
+        call_command("run_inventory_jobs", "--once", stdout=io.StringIO())
+
+        download_url = self.client.get(reverse("inventory-jobs-detail", args=[job_id])).json()["download_url"]
+        body = b"".join(self.client.get(download_url).streaming_content).decode("utf-8")
+        self.assertIn(",wipes,", body)
+
+        other = CustomUser.objects.create_user(username="other", password="12345678", role="supplier")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(download_url).status_code, 404)
+
+        # Stored privately under a per-job path, so jobs never share a file
+        job = Job.objects.get()
+        self.assertEqual(job.artefact.name, f"jobs/{job.id}/artefact/inventory.csv")
+        self.assertTrue(job.artefact.path.startswith(settings.PRIVATE_MEDIA_ROOT))
+
+    def test_admin_shows_job_with_private_files(self):
+        job = Job(kind="export", user=self.supplier, status="succeeded")
+        job.artefact.save("inventory.csv", ContentFile(b"ID\n"), save=False)
+        job.save()
+        admin = CustomUser.objects.create_superuser(username="admin", password="12345678")
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin:inventory_job_change", args=[job.pk]))
+        self.assertContains(response, job.artefact.name)
+
+    def test_abandoned_jobs_are_requeued_and_old_jobs_purged(self):
+        stale = timezone.now() - timedelta(hours=2)
+        abandoned = Job.objects.create(
+            kind="export", user=self.supplier, status="running", heartbeat_at=stale, attempts=1
+        )
+        exhausted = Job.objects.create(
+            kind="export", user=self.supplier, status="running", heartbeat_at=stale, attempts=3
+        )
+        self.client.get(reverse("export-inventory"), {"async": "1"})
+        call_command("run_inventory_jobs", "--once", stdout=io.StringIO())
+
+        abandoned.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(abandoned.status, "pending")
+        self.assertEqual(exhausted.status, "failed")
+
+        finished = Job.objects.get(status="succeeded")
+        path = finished.artefact.path
+        Job.objects.filter(pk=finished.pk).update(finished_at=timezone.now() - timedelta(days=8))
+        call_command("run_inventory_jobs", "--once", stdout=io.StringIO())
+        self.assertFalse(Job.objects.filter(pk=finished.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class JobHeartbeatTests(TransactionTestCase):
+    # The heartbeat thread uses its own connection, so the job must be committed
+    def test_running_job_keeps_its_heartbeat_fresh(self):
+        user = CustomUser.objects.create_user(username="supervisor", password="12345678", role="supervisor")
+        started = timezone.now() - timedelta(hours=1)
+        job = Job.objects.create(kind="export", user=user, status="running", heartbeat_at=started)
+
+        def slow_export(job):
+            deadline = time.monotonic() + 5
+            while Job.objects.get(pk=job.pk).heartbeat_at == started and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        with mock.patch("inventory.jobs.HEARTBEAT_INTERVAL", 0.01), \
+                mock.patch.dict("inventory.jobs.JOB_HANDLERS", {"export": slow_export}):
+            run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, "succeeded")
+        self.assertGreater(job.heartbeat_at, started)
+
+
+class InventoryReportTests(InventoryTestCase):
+    def test_transaction_report_shows_net_change(self):
+        product = self.create_product(name="wipes")
+        for transaction_type, quantity in (("add", 7), ("remove", 3)):
+            InventoryTransaction.objects.create(
+                product=product, quantity=quantity, previous_stock=50, new_stock=50,
+                transaction_type=transaction_type, performed_by=self.supplier
+            )
+
+        response = self.client.get(reverse("inventory-reports"), {"type": "transactions", "format": "html"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span class="success">+4</span>', html=True)
+
+    def test_transaction_details_are_capped(self):
+        product = self.create_product(name="wipes")
+        for _ in range(3):
+            InventoryTransaction.objects.create(
+                product=product, quantity=1, previous_stock=50, new_stock=51,
+                transaction_type="add", notes="restock", performed_by=self.supplier
+            )
+
+        with self.settings(REPORT_SECTION_ROW_LIMIT=2):
+            response = self.client.get(reverse("inventory-reports"), {"type": "transactions", "format": "html"})
+        self.assertContains(response, "<td>restock</td>", count=2, html=True)
+        self.assertContains(response, "<td>supplier</td>", count=2, html=True)
+        self.assertContains(response, "Showing the 2 most recent of 3")
+
+    def test_report_cache_key_follows_data_version(self):
+        product = self.create_product()
+        params = {"type": "low_stock"}
+        key = report_cache_key(self.supplier, params)
+        self.assertEqual(report_cache_key(self.supplier, params), key)
+        self.assertNotEqual(report_cache_key(self.supplier, {"type": "inventory"}), key)
+
+        # Written as the job worker or consumer would, without any cache bump
+        Product.objects.filter(pk=product.pk).update(stock=3, last_update=timezone.now())
+        self.assertNotEqual(report_cache_key(self.supplier, params), key)
+
+        params = {"type": "transactions"}
+        key = report_cache_key(self.supplier, params)
+        InventoryTransaction.objects.create(
+            product=product, quantity=1, previous_stock=3, new_stock=4,
+            transaction_type="add", performed_by=self.supplier
+        )
+        self.assertNotEqual(report_cache_key(self.supplier, params), key)
+
+    def test_render_timeout_answers_504_and_keeps_slot_until_render_ends(self):
+        finish = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        slots = threading.BoundedSemaphore(1)
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(finish.set)
+
+        with mock.patch("inventory.pdf.get_render_pool", return_value=(executor, slots)), \
+                mock.patch("inventory.pdf.write_pdf", side_effect=lambda *args: finish.wait()), \
+                mock.patch("inventory.views.pdf_rendering_available", return_value=True), \
+                self.settings(REPORT_RENDER_TIMEOUT=0.1):
+            response = self.client.get(reverse("inventory-reports"))
+            self.assertEqual(response.status_code, 504)
+            self.assertFalse(slots.acquire(blocking=False))
+
+            finish.set()
+            executor.shutdown(wait=True)
+            self.assertTrue(slots.acquire(blocking=False))
@@ -7,6 +7,7 @@ router.register(r'products', views.ProductInventoryViewSet, basename='inventory-
 router.register(r'transactions', views.InventoryTransactionViewSet, basename='inventory-transactions')
 router.register(r'alerts', views.LowStockAlertViewSet, basename='low-stock-alerts')
 router.register(r'price-history', views.PriceChangeLogViewSet, basename='price-history')
+router.register(r'jobs', views.JobViewSet, basename='inventory-jobs')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,44 +1,48 @@
 from django.shortcuts import render, get_object_or_404
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import F, Count, Sum, Avg, Q
+from django.db import transaction, connection
+from django.db.models import Count, Q
 from rest_framework import viewsets, status, filters
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.views import APIView
 from django.utils.dateparse import parse_date
 from datetime import timedelta
-import csv
-import io
-import openpyxl
-from django.http import HttpResponse
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment, PatternFill
-from django.template.loader import render_to_string
-# from weasyprint import HTML  # Temporarily commented out due to missing GTK dependencies
-import tempfile
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from django.urls import reverse
 from django.conf import settings
 import os
-from django.db.models import Sum, Count, Case, When, IntegerField
+import uuid
 
 from core.models import Product
+from core.aggregates import recompute_package_total_prices_for_products, refresh_package_stock_for_products
+from core.pagination import OptInCursorPagination
+from core.cache import ConditionalRetrieveMixin
 from core.permissions import IsSupplier, IsPackageCombinator, IsSupervisor
-from .models import InventoryTransaction, LowStockAlert, PriceChangeLog
+from .models import InventoryTransaction, LowStockAlert, PriceChangeLog, DailyInventoryRollup, DailyPriceRollup, Job
+from .jobs import enqueue_job
+from .importers import import_stock_file
+from .reports import render_inventory_report, render_inventory_report_pdf
+from .pdf import pdf_rendering_available, ReportRenderBusy, ReportRenderTimeout
+from .exports import inventory_export_rows, stream_inventory_csv, write_inventory_workbook
+from .rollups import inventory_totals, price_totals
 from .serializers import (
     ProductInventorySerializer, InventoryTransactionSerializer, 
     LowStockAlertSerializer, PriceChangeLogSerializer,
     StockUpdateSerializer, BulkStockUpdateSerializer,
-    PriceUpdateSerializer, BulkPriceUpdateSerializer
+    PriceUpdateSerializer, BulkPriceUpdateSerializer, JobSerializer
 )
 from .kafka_utils import (
     send_inventory_update, send_low_stock_alert, 
     send_price_change_event, send_product_created_event,
-    send_product_deleted_event
+    send_product_deleted_event, inventory_update_events,
+    price_change_events, enqueue_events
 )
 
-class ProductInventoryViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductInventoryViewSet(ConditionalRetrieveMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = ProductInventorySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -54,12 +58,28 @@ class ProductInventoryViewSet(viewsets.ReadOnlyModelViewSet):
             return Product.objects.all()
         return Product.objects.filter(is_active=True)
 
+    def get_validators(self):
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            # Let the regular lookup answer with its 404
+            return None
+        last_update = self.get_queryset() \
+            .filter(pk=pk) \
+            .values_list('last_update', flat=True) \
+            .first()
+        if last_update is None:
+            return None
+        return (pk, last_update), last_update
+
 class InventoryTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = InventoryTransactionSerializer
     permission_classes = [IsAuthenticated & (IsSupplier | IsSupervisor)]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['product', 'transaction_type', 'performed_by']
     ordering_fields = ['timestamp', 'quantity']
+    ordering = ['-timestamp', '-id']
+    pagination_class = OptInCursorPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -123,6 +143,8 @@ class PriceChangeLogViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['product', 'changed_by']
     ordering_fields = ['changed_at']
+    ordering = ['-changed_at', '-id']
+    pagination_class = OptInCursorPagination
     
     def get_queryset(self):
         user = self.request.user
@@ -130,6 +152,48 @@ class PriceChangeLogViewSet(viewsets.ReadOnlyModelViewSet):
             return PriceChangeLog.objects.filter(product__provider=user)
         return PriceChangeLog.objects.all()
 
+def apply_stock_change(product_id, provider_id, transaction_type, quantity):
+    # A single conditional UPDATE ... RETURNING: the stock check and the write
+    # happen in one statement, so concurrent removals cannot oversell and the
+    # row lock is taken only for the write itself. Returns (previous, new)
+    # stock, or None when the product is missing or has too little stock.
+    table = connection.ops.quote_name(Product._meta.db_table)
+    if transaction_type == 'adjust':
+        # The previous value has to be read from the pre-update row
+        sql = f"""
+            UPDATE {table} AS product SET stock = %s, last_update = %s
+            FROM (SELECT id, stock FROM {table} WHERE id = %s AND provider_id = %s FOR UPDATE) AS previous
+            WHERE product.id = previous.id
+            RETURNING previous.stock, product.stock
+        """
+        params = [quantity, timezone.now(), product_id, provider_id]
+    elif transaction_type == 'remove':
+        sql = f"""
+            UPDATE {table} SET stock = stock - %s, last_update = %s
+            WHERE id = %s AND provider_id = %s AND stock >= %s
+            RETURNING stock + %s, stock
+        """
+        params = [quantity, timezone.now(), product_id, provider_id, quantity, quantity]
+    elif transaction_type == 'add':
+        sql = f"""
+            UPDATE {table} SET stock = stock + %s, last_update = %s
+            WHERE id = %s AND provider_id = %s
+            RETURNING stock - %s, stock
+        """
+        params = [quantity, timezone.now(), product_id, provider_id, quantity]
+    else:
+        # Other types are recorded without changing the stock
+        sql = f"""
+            UPDATE {table} SET last_update = %s
+            WHERE id = %s AND provider_id = %s
+            RETURNING stock, stock
+        """
+        params = [timezone.now(), product_id, provider_id]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated & IsSupplier])
 def update_stock(request):
@@ -144,46 +208,45 @@ def update_stock(request):
     
     try:
         with transaction.atomic():
-            product = get_object_or_404(Product, id=product_id, provider=request.user)
-            previous_stock = product.stock
-            
-            if transaction_type == 'add':
-                product.stock = F('stock') + quantity
-            elif transaction_type == 'remove':
-                if product.stock < quantity:
+            stock = apply_stock_change(product_id, request.user.id, transaction_type, quantity)
+            if stock is None:
+                if not Product.objects.filter(id=product_id, provider=request.user).exists():
                     return Response(
-                        {"detail": "Not enough stock available."},
-                        status=status.HTTP_400_BAD_REQUEST
+                        {"detail": "No Product matches the given query."},
+                        status=status.HTTP_404_NOT_FOUND
                     )
-                product.stock = F('stock') - quantity
-            elif transaction_type == 'adjust':
-                product.stock = quantity
-            
-            product.save()
-            product.refresh_from_db()
+                return Response(
+                    {"detail": "Not enough stock available."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            previous_stock, new_stock = stock
             
+            event_id = uuid.uuid4()
             InventoryTransaction.objects.create(
-                product=product,
+                product_id=product_id,
                 quantity=quantity if transaction_type != 'adjust' else (quantity - previous_stock),
                 previous_stock=previous_stock,
-                new_stock=product.stock,
+                new_stock=new_stock,
                 transaction_type=transaction_type,
                 notes=notes,
-                performed_by=request.user
+                performed_by=request.user,
+                event_id=event_id
             )
+            refresh_package_stock_for_products([product_id])
             
             send_inventory_update(
-                product_id=product.id,
+                product_id=product_id,
                 old_stock=previous_stock,
-                new_stock=product.stock,
-                user_id=request.user.id
+                new_stock=new_stock,
+                user_id=request.user.id,
+                event_id=event_id
             )
             
             return Response({
                 "detail": "Stock updated successfully.",
-                "product_id": product.id,
+                "product_id": product_id,
                 "previous_stock": previous_stock,
-                "new_stock": product.stock
+                "new_stock": new_stock
             }, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -209,56 +272,95 @@ def bulk_update_stock(request):
         'failed': []
     }
     
-    for product_id in product_ids:
-        try:
-            with transaction.atomic():
-                product = get_object_or_404(Product, id=product_id, provider=request.user)
+    try:
+        with transaction.atomic():
+            # Lock every affected row up front, in a stable order, instead of
+            # fetching and saving each product in its own transaction.
+            products = {
+                product.id: product
+                for product in Product.objects
+                    .select_for_update()
+                    .filter(id__in=product_ids, provider=request.user)
+                    .only('id', 'stock')
+                    .order_by('id')
+            }
+            
+            now = timezone.now()
+            ledger = []
+            events = []
+            
+            for product_id in product_ids:
+                product = products.get(product_id)
+                if product is None:
+                    results['failed'].append({
+                        'product_id': product_id,
+                        'reason': 'No Product matches the given query.'
+                    })
+                    continue
+                
                 previous_stock = product.stock
+                new_stock = previous_stock
                 
                 if transaction_type == 'add':
-                    product.stock = F('stock') + quantity
+                    new_stock = previous_stock + quantity
                 elif transaction_type == 'remove':
-                    if product.stock < quantity:
+                    if previous_stock < quantity:
                         results['failed'].append({
                             'product_id': product_id,
                             'reason': 'Not enough stock available'
                         })
                         continue
-                    product.stock = F('stock') - quantity
+                    new_stock = previous_stock - quantity
                 elif transaction_type == 'adjust':
-                    product.stock = quantity
+                    new_stock = quantity
+                
+                if new_stock < 0:
+                    results['failed'].append({
+                        'product_id': product_id,
+                        'reason': 'Stock cannot be negative'
+                    })
+                    continue
                 
-                product.save()
-                product.refresh_from_db()
+                product.stock = new_stock
+                product.last_update = now
                 
-                InventoryTransaction.objects.create(
-                    product=product,
+                event_id = uuid.uuid4()
+                ledger.append(InventoryTransaction(
+                    product_id=product.id,
                     quantity=quantity if transaction_type != 'adjust' else (quantity - previous_stock),
                     previous_stock=previous_stock,
-                    new_stock=product.stock,
+                    new_stock=new_stock,
                     transaction_type=transaction_type,
                     notes=notes,
-                    performed_by=request.user
-                )
-                
-                send_inventory_update(
-                    product_id=product.id,
-                    old_stock=previous_stock,
-                    new_stock=product.stock,
-                    user_id=request.user.id
-                )
+                    performed_by=request.user,
+                    timestamp=now,
+                    event_id=event_id
+                ))
+                events.extend(inventory_update_events(
+                    product.id, previous_stock, new_stock, request.user.id, event_id
+                ))
                 
                 results['successful'].append({
                     'product_id': product.id,
                     'previous_stock': previous_stock,
-                    'new_stock': product.stock
+                    'new_stock': new_stock
                 })
-                
-        except Exception as e:
-            results['failed'].append({
-                'product_id': product_id,
-                'reason': str(e)
-            })
+            
+            if ledger:
+                updated_ids = {entry.product_id for entry in ledger}
+                Product.objects.bulk_update(
+                    [products[product_id] for product_id in updated_ids],
+                    ['stock', 'last_update']
+                )
+                refresh_package_stock_for_products(updated_ids)
+                InventoryTransaction.objects.bulk_create(ledger)
+                enqueue_events(events)
+    
+    except Exception as e:
+        return Response(
+            {"detail": f"Error updating stock: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
     
     return Response({
         "detail": "Bulk stock update completed.",
@@ -278,7 +380,9 @@ def update_price(request):
     
     try:
         with transaction.atomic():
-            product = get_object_or_404(Product, id=product_id, provider=request.user)
+            product = get_object_or_404(
+                Product.objects.select_for_update(), id=product_id, provider=request.user
+            )
             old_price = product.price
             
             if old_price == new_price:
@@ -291,19 +395,22 @@ def update_price(request):
             product.price = new_price
             product.save()
             
+            event_id = uuid.uuid4()
             PriceChangeLog.objects.create(
                 product=product,
                 old_price=old_price,
                 new_price=new_price,
                 changed_by=request.user,
-                notes=notes
+                notes=notes,
+                event_id=event_id
             )
             
             send_price_change_event(
                 product_id=product.id,
                 old_price=old_price,
                 new_price=new_price,
-                user_id=request.user.id
+                user_id=request.user.id,
+                event_id=event_id
             )
             
             return Response({
@@ -335,12 +442,31 @@ def bulk_update_price(request):
         'failed': []
     }
     
-    for product_id in product_ids:
-        try:
-            with transaction.atomic():
-                product = get_object_or_404(Product, id=product_id, provider=request.user)
-                old_price = product.price
+    try:
+        with transaction.atomic():
+            products = {
+                product.id: product
+                for product in Product.objects
+                    .select_for_update()
+                    .filter(id__in=product_ids, provider=request.user)
+                    .only('id', 'price')
+                    .order_by('id')
+            }
+            
+            now = timezone.now()
+            price_logs = []
+            events = []
+            
+            for product_id in product_ids:
+                product = products.get(product_id)
+                if product is None:
+                    results['failed'].append({
+                        'product_id': product_id,
+                        'reason': 'No Product matches the given query.'
+                    })
+                    continue
                 
+                old_price = product.price
                 if old_price == new_price:
                     results['successful'].append({
                         'product_id': product.id,
@@ -350,34 +476,42 @@ def bulk_update_price(request):
                     continue
                 
                 product.price = new_price
-                product.save()
-                
-                PriceChangeLog.objects.create(
-                    product=product,
-                    old_price=old_price,
-                    new_price=new_price,
-                    changed_by=request.user,
-                    notes=notes
-                )
                 
-                send_price_change_event(
+                event_id = uuid.uuid4()
+                price_logs.append(PriceChangeLog(
                     product_id=product.id,
                     old_price=old_price,
                     new_price=new_price,
-                    user_id=request.user.id
-                )
+                    changed_by=request.user,
+                    changed_at=now,
+                    notes=notes,
+                    event_id=event_id
+                ))
+                events.extend(price_change_events(
+                    product.id, old_price, new_price, request.user.id, event_id
+                ))
                 
                 results['successful'].append({
                     'product_id': product.id,
                     'old_price': old_price,
                     'new_price': new_price
                 })
-                
-        except Exception as e:
-            results['failed'].append({
-                'product_id': product_id,
-                'reason': str(e)
-            })
+            
+            if price_logs:
+                changed_ids = {log.product_id for log in price_logs}
+                # A single UPDATE for every product; bypassing save() also skips the
+                # per-product package signal, so each affected package total is
+                # recomputed exactly once below.
+                Product.objects.filter(id__in=changed_ids).update(price=new_price, last_update=now)
+                recompute_package_total_prices_for_products(changed_ids)
+                PriceChangeLog.objects.bulk_create(price_logs)
+                enqueue_events(events)
+    
+    except Exception as e:
+        return Response(
+            {"detail": f"Error updating price: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
     
     return Response({
         "detail": "Bulk price update completed.",
@@ -393,10 +527,12 @@ class InventoryDashboardView(APIView):
         date_to = request.query_params.get('date_to')
         
         transactions_filter = Q()
+        rollups_filter = Q()
         if date_from:
             try:
                 date_from = parse_date(date_from)
                 transactions_filter &= Q(timestamp__gte=date_from)
+                rollups_filter &= Q(day__gte=date_from)
             except:
                 pass
         
@@ -405,6 +541,7 @@ class InventoryDashboardView(APIView):
                 date_to = parse_date(date_to)
                 date_to = date_to + timedelta(days=1)
                 transactions_filter &= Q(timestamp__lt=date_to)
+                rollups_filter &= Q(day__lt=date_to)
             except:
                 pass
         
@@ -413,76 +550,70 @@ class InventoryDashboardView(APIView):
             transactions = InventoryTransaction.objects.filter(
                 product__provider=user
             ).filter(transactions_filter)
+            inventory_rollups = DailyInventoryRollup.objects.filter(
+                product__provider=user
+            ).filter(rollups_filter)
             alerts = LowStockAlert.objects.filter(product__provider=user)
             price_changes = PriceChangeLog.objects.filter(product__provider=user)
+            price_rollups = DailyPriceRollup.objects.filter(product__provider=user)
         else:
             products = Product.objects.all()
             transactions = InventoryTransaction.objects.filter(transactions_filter)
+            inventory_rollups = DailyInventoryRollup.objects.filter(rollups_filter)
             alerts = LowStockAlert.objects.all()
             price_changes = PriceChangeLog.objects.all()
+            price_rollups = DailyPriceRollup.objects.all()
         
-        total_products = products.count()
-        active_products = products.filter(is_active=True).count()
-        low_stock_products = products.filter(stock__lte=settings.LOW_STOCK_THRESHOLD).count()
-        out_of_stock_products = products.filter(stock=0).count()
-        
-        total_transactions = transactions.count()
-        add_transactions = transactions.filter(transaction_type='add').aggregate(
-            count=Count('id'),
-            total_quantity=Sum('quantity')
-        )
-        remove_transactions = transactions.filter(transaction_type='remove').aggregate(
-            count=Count('id'),
-            total_quantity=Sum('quantity')
+        product_stats = products.aggregate(
+            total_products=Count('id'),
+            active_products=Count('id', filter=Q(is_active=True)),
+            low_stock_products=Count('id', filter=Q(stock__lte=settings.LOW_STOCK_THRESHOLD)),
+            out_of_stock_products=Count('id', filter=Q(stock=0)),
         )
         
-        pending_alerts = alerts.filter(status='pending').count()
-        acknowledged_alerts = alerts.filter(status='acknowledged').count()
-        resolved_alerts = alerts.filter(status='resolved').count()
+        # Closed days are read from the daily rollups, only today from the ledger
+        transaction_stats = inventory_totals(inventory_rollups, transactions)
+        total_transactions = transaction_stats['transaction_count']
+        add_transactions = {
+            'count': transaction_stats['add_count'],
+            'total_quantity': transaction_stats['add_quantity'],
+        }
+        remove_transactions = {
+            'count': transaction_stats['remove_count'],
+            'total_quantity': transaction_stats['remove_quantity'],
+        }
         
-        total_price_changes = price_changes.count()
-        avg_price_increase = price_changes.filter(
-            new_price__gt=F('old_price')
-        ).aggregate(
-            avg_increase=Avg(F('new_price') - F('old_price'))
-        )['avg_increase'] or 0
+        alert_stats = alerts.aggregate(
+            pending_alerts=Count('id', filter=Q(status='pending')),
+            acknowledged_alerts=Count('id', filter=Q(status='acknowledged')),
+            resolved_alerts=Count('id', filter=Q(status='resolved')),
+        )
         
-        avg_price_decrease = price_changes.filter(
-            new_price__lt=F('old_price')
-        ).aggregate(
-            avg_decrease=Avg(F('old_price') - F('new_price'))
-        )['avg_decrease'] or 0
+        price_stats = price_totals(price_rollups, price_changes)
         
-        recent_transactions = transactions.order_by('-timestamp')[:10]
+        recent_transactions = transactions.select_related('product', 'performed_by').order_by('-timestamp')[:10]
         recent_transactions_data = InventoryTransactionSerializer(recent_transactions, many=True).data
         
-        recent_alerts = alerts.order_by('-created_at')[:10]
+        recent_alerts = alerts.select_related('product', 'acknowledged_by').order_by('-created_at')[:10]
         recent_alerts_data = LowStockAlertSerializer(recent_alerts, many=True).data
         
-        recent_price_changes = price_changes.order_by('-changed_at')[:10]
+        recent_price_changes = price_changes.select_related('product', 'changed_by').order_by('-changed_at')[:10]
         recent_price_changes_data = PriceChangeLogSerializer(recent_price_changes, many=True).data
         
         return Response({
-            'product_stats': {
-                'total_products': total_products,
-                'active_products': active_products,
-                'low_stock_products': low_stock_products,
-                'out_of_stock_products': out_of_stock_products,
-            },
+            'product_stats': product_stats,
             'transaction_stats': {
                 'total_transactions': total_transactions,
                 'add_transactions': add_transactions,
                 'remove_transactions': remove_transactions,
             },
-            'alert_stats': {
-                'pending_alerts': pending_alerts,
-                'acknowledged_alerts': acknowledged_alerts,
-                'resolved_alerts': resolved_alerts,
-            },
+            'alert_stats': alert_stats,
             'price_stats': {
-                'total_price_changes': total_price_changes,
-                'avg_price_increase': avg_price_increase,
-                'avg_price_decrease': avg_price_decrease,
+                'total_price_changes': price_stats['change_count'],
+                'avg_price_increase': price_stats['increase_total'] / price_stats['increase_count']
+                if price_stats['increase_count'] else 0,
+                'avg_price_decrease': price_stats['decrease_total'] / price_stats['decrease_count']
+                if price_stats['decrease_count'] else 0,
             },
             'recent_data': {
                 'transactions': recent_transactions_data,
@@ -491,80 +622,71 @@ class InventoryDashboardView(APIView):
             }
         }, status=status.HTTP_200_OK)
 
+def wants_async(request):
+    return request.query_params.get('async') in ('1', 'true')
+
+def job_accepted_response(request, job):
+    return Response({
+        "detail": "Job queued.",
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": request.build_absolute_uri(reverse('inventory-jobs-detail', args=[job.id])),
+    }, status=status.HTTP_202_ACCEPTED)
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if not job.artefact:
+            return Response(
+                {"detail": "Job has no file to download."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return FileResponse(
+            job.artefact.open('rb'),
+            as_attachment=True,
+            filename=os.path.basename(job.artefact.name)
+        )
+
+class CSVFormatRenderer(JSONRenderer):
+    # Lets ?format=... through DRF's format override; errors still render as JSON
+    format = 'csv'
+
+
+class ExcelFormatRenderer(JSONRenderer):
+    format = 'excel'
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated & (IsSupplier | IsSupervisor)])
+@renderer_classes([JSONRenderer, CSVFormatRenderer, ExcelFormatRenderer])
 def export_inventory(request):
     export_format = request.query_params.get('format', 'csv')
     user = request.user
     
-    if user.role == 'supplier':
-        products = Product.objects.filter(provider=user, is_deleted=False)
-    else:
-        products = Product.objects.filter(is_deleted=False)
-    
+    if wants_async(request):
+        return job_accepted_response(request, enqueue_job('export', user, {'format': export_format}))
+
+    rows = inventory_export_rows(user)
+
     if export_format == 'excel':
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Inventory"
-        
-        headers = ['ID', 'Name', 'Type', 'Price', 'Stock', 'Active', 'Provider']
-        
-        header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        header_font = Font(color='FFFFFF', bold=True)
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        for row_num, product in enumerate(products, 2):
-            ws.cell(row=row_num, column=1).value = product.id
-            ws.cell(row=row_num, column=2).value = product.name
-            ws.cell(row=row_num, column=3).value = product.type
-            ws.cell(row=row_num, column=4).value = product.price
-            ws.cell(row=row_num, column=5).value = product.stock
-            ws.cell(row=row_num, column=6).value = 'Yes' if product.is_active else 'No'
-            ws.cell(row=row_num, column=7).value = product.provider.username
-            
-            if product.stock <= settings.LOW_STOCK_THRESHOLD:
-                for col_num in range(1, 8):
-                    cell = ws.cell(row=row_num, column=col_num)
-                    if product.stock == 0:
-                        cell.fill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
-                    else:
-                        cell.fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-        
-        for col_num in range(1, 8):
-            ws.column_dimensions[get_column_letter(col_num)].width = 15
-        
-        response = HttpResponse(
+        response = FileResponse(
+            write_inventory_workbook(rows),
+            as_attachment=True,
+            filename='inventory.xlsx',
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        response['Content-Disposition'] = 'attachment; filename=inventory.xlsx'
-        
-        wb.save(response)
         return response
-    
+
     else:
-        response = HttpResponse(content_type='text/csv')
+        response = StreamingHttpResponse(stream_inventory_csv(rows), content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename=inventory.csv'
-        
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'Name', 'Type', 'Price', 'Stock', 'Active', 'Provider'])
-        
-        for product in products:
-            writer.writerow([
-                product.id,
-                product.name,
-                product.type,
-                product.price,
-                product.stock,
-                'Yes' if product.is_active else 'No',
-                product.provider.username
-            ])
-        
         return response
 
 @api_view(['POST'])
@@ -579,251 +701,58 @@ def import_inventory(request):
     file = request.FILES['file']
     file_extension = file.name.split('.')[-1].lower()
     
-    results = {
-        'successful': [],
-        'failed': []
-    }
+    if file_extension not in ('xlsx', 'csv'):
+        return Response(
+            {"detail": "Unsupported file format. Please upload CSV or Excel file."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if wants_async(request):
+        return job_accepted_response(
+            request, enqueue_job('import', request.user, {'format': file_extension}, source=file)
+        )
     
     try:
-        if file_extension == 'xlsx':
-            wb = openpyxl.load_workbook(file)
-            ws = wb.active
-            
-            rows = list(ws.rows)[1:]
-            
-            for row in rows:
-                try:
-                    product_id = row[0].value
-                    if not product_id:
-                        continue
-                    
-                    product = get_object_or_404(
-                        Product, 
-                        id=product_id, 
-                        provider=request.user,
-                        is_deleted=False
-                    )
-                    
-                    new_stock = int(row[4].value)
-                    old_stock = product.stock
-                    
-                    product.stock = new_stock
-                    product.save()
-                    
-                    transaction_type = 'adjust'
-                    InventoryTransaction.objects.create(
-                        product=product,
-                        quantity=new_stock - old_stock,
-                        previous_stock=old_stock,
-                        new_stock=new_stock,
-                        transaction_type=transaction_type,
-                        notes='Imported from Excel',
-                        performed_by=request.user
-                    )
-                    
-                    send_inventory_update(
-                        product_id=product.id,
-                        old_stock=old_stock,
-                        new_stock=new_stock,
-                        user_id=request.user.id
-                    )
-                    
-                    results['successful'].append({
-                        'product_id': product.id,
-                        'name': product.name,
-                        'previous_stock': old_stock,
-                        'new_stock': new_stock
-                    })
-                    
-                except Exception as e:
-                    results['failed'].append({
-                        'product_id': product_id if 'product_id' in locals() else 'Unknown',
-                        'reason': str(e)
-                    })
-        
-        elif file_extension == 'csv':
-            decoded_file = file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.reader(io_string)
-            
-            next(reader)
-            
-            for row in reader:
-                try:
-                    if not row or not row[0]:
-                        continue
-                    
-                    product_id = int(row[0])
-                    product = get_object_or_404(
-                        Product, 
-                        id=product_id, 
-                        provider=request.user,
-                        is_deleted=False
-                    )
-                    
-                    new_stock = int(row[4])
-                    old_stock = product.stock
-                    
-                    product.stock = new_stock
-                    product.save()
-                    
-                    transaction_type = 'adjust'
-                    InventoryTransaction.objects.create(
-                        product=product,
-                        quantity=new_stock - old_stock,
-                        previous_stock=old_stock,
-                        new_stock=new_stock,
-                        transaction_type=transaction_type,
-                        notes='Imported from CSV',
-                        performed_by=request.user
-                    )
-
-                    send_inventory_update(
-                        product_id=product.id,
-                        old_stock=old_stock,
-                        new_stock=new_stock,
-                        user_id=request.user.id
-                    )
-                    
-                    results['successful'].append({
-                        'product_id': product.id,
-                        'name': product.name,
-                        'previous_stock': old_stock,
-                        'new_stock': new_stock
-                    })
-                    
-                except Exception as e:
-                    results['failed'].append({
-                        'product_id': row[0] if row and len(row) > 0 else 'Unknown',
-                        'reason': str(e)
-                    })
-        
-        else:
-            return Response(
-                {"detail": "Unsupported file format. Please upload CSV or Excel file."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        return Response({
-            "detail": "Import completed.",
-            "results": results
-        }, status=status.HTTP_200_OK)
-        
+        results = import_stock_file(file, file_extension, request.user)
     except Exception as e:
         return Response(
             {"detail": f"Error processing file: {str(e)}"},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    
+    return Response({
+        "detail": "Import completed.",
+        "results": results
+    }, status=status.HTTP_200_OK)
+
+class HTMLFormatRenderer(JSONRenderer):
+    format = 'html'
+
+
+class PDFFormatRenderer(JSONRenderer):
+    format = 'pdf'
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated & (IsSupplier | IsSupervisor)])
+@renderer_classes([JSONRenderer, HTMLFormatRenderer, PDFFormatRenderer])
 def generate_inventory_report(request):
-    user = request.user
-    report_type = request.query_params.get('type', 'inventory')
-    date_from = request.query_params.get('date_from')
-    date_to = request.query_params.get('date_to')
+    if wants_async(request):
+        params = {key: value for key, value in request.query_params.items() if key != 'async'}
+        return job_accepted_response(request, enqueue_job('report', request.user, params))
     
-    date_filter = Q()
-    if date_from:
-        try:
-            date_from = parse_date(date_from)
-            date_filter &= Q(timestamp__gte=date_from)
-        except:
-            pass
+    # PDF unless HTML is asked for or weasyprint is not installed
+    if request.query_params.get('format') == 'html' or not pdf_rendering_available():
+        html_string = render_inventory_report(request.user, request.query_params)
+        return HttpResponse(html_string, content_type='text/html')
     
-    if date_to:
-        try:
-            date_to = parse_date(date_to)
-            date_to = date_to + timedelta(days=1)
-            date_filter &= Q(timestamp__lt=date_to)
-        except:
-            pass
-    
-    if user.role == 'supplier':
-        products = Product.objects.filter(provider=user, is_deleted=False)
-        transactions = InventoryTransaction.objects.filter(
-            product__provider=user
-        ).filter(date_filter)
-    else:
-        products = Product.objects.filter(is_deleted=False)
-        transactions = InventoryTransaction.objects.filter(date_filter)
-    
-    context = {
-        'user': user,
-        'generated_at': timezone.now(),
-        'date_from': date_from,
-        'date_to': date_to if date_to else timezone.now(),
-    }
-    
-    if report_type == 'transactions':
-        context['report_title'] = 'Inventory Transaction Report'
-        context['transactions'] = transactions.order_by('-timestamp')
-        
-        transaction_summary = transactions.values('transaction_type').annotate(
-            count=Count('id'),
-            total_quantity=Sum('quantity')
-        )
-        context['transaction_summary'] = transaction_summary
-        
-        product_transactions = transactions.values('product__name').annotate(
-            count=Count('id'),
-            total_quantity=Sum('quantity'),
-            additions=Sum(Case(
-                When(transaction_type='add', then='quantity'),
-                default=0,
-                output_field=IntegerField()
-            )),
-            removals=Sum(Case(
-                When(transaction_type='remove', then='quantity'),
-                default=0,
-                output_field=IntegerField()
-            ))
-        ).order_by('-count')
-        context['product_transactions'] = product_transactions
-        
-        template_name = 'inventory/transaction_report.html'
-    
-    elif report_type == 'low_stock':
-        low_stock_products = products.filter(stock__lte=settings.LOW_STOCK_THRESHOLD)
-        context['report_title'] = 'Low Stock Report'
-        context['low_stock_products'] = low_stock_products
-        context['threshold'] = settings.LOW_STOCK_THRESHOLD
-        
-        stock_levels = low_stock_products.values('stock').annotate(
-            count=Count('id')
-        ).order_by('stock')
-        context['stock_levels'] = stock_levels
-        
-        out_of_stock = low_stock_products.filter(stock=0).count()
-        context['out_of_stock'] = out_of_stock
-        
-        template_name = 'inventory/low_stock_report.html'
-    
-    else:
-        context['report_title'] = 'Inventory Status Report'
-        context['products'] = products
-        
-        total_products = products.count()
-        active_products = products.filter(is_active=True).count()
-        low_stock_products = products.filter(stock__lte=settings.LOW_STOCK_THRESHOLD).count()
-        out_of_stock_products = products.filter(stock=0).count()
-        
-        context['inventory_summary'] = {
-            'total_products': total_products,
-            'active_products': active_products,
-            'low_stock_products': low_stock_products,
-            'out_of_stock_products': out_of_stock_products,
-        }
-        
-        product_types = products.values('type').annotate(
-            count=Count('id'),
-            total_stock=Sum('stock')
-        ).order_by('type')
-        context['product_types'] = product_types
-        
-        template_name = 'inventory/inventory_report.html'
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        html_string = render_to_string(template_name, context)
-        response = HttpResponse(html_string, content_type='text/html')
-        return response
+    try:
+        pdf = render_inventory_report_pdf(request.user, request.query_params)
+    except ReportRenderBusy as e:
+        return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except ReportRenderTimeout as e:
+        return Response({"detail": str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+    
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename=inventory_report.pdf'
+    return response